@@ -4,14 +4,16 @@ This is free and unencumbered software released into the public domain.
 :Authors: Kevin Lundeen
 :Version: f19-02
 """
-import pickle
 import socketserver
+import struct
 import sys
 
-BUF_SZ = 1024  # tcp receive buffer size
+import msgpack
 
+HEADER = struct.Struct('>I')  # 4-byte big-endian length prefix on every message
 
-class GroupCoordinatorDaemon(socketserver.BaseRequestHandler):
+
+class GroupCoordinatorDaemon(socketserver.StreamRequestHandler):
     """
     A Group Coordinator Daemon (GCD) which will respond with a list of potential group members to a text message JOIN
     with list of group members to contact.
@@ -26,18 +28,21 @@ class GroupCoordinatorDaemon(socketserver.BaseRequestHandler):
         """
         Handles the incoming messages - expects only 'JOIN' messages
         """
-        raw = self.request.recv(BUF_SZ)  # self.request is the TCP socket connected to the client
+        header = self.rfile.read(HEADER.size)  # rfile reads from the TCP socket connected to the client
         print(self.client_address)
+        if len(header) < HEADER.size:
+            return
+        raw = self.rfile.read(HEADER.unpack(header)[0])
         try:
-            message = pickle.loads(raw)
-        except (pickle.PickleError, KeyError):
-            response = bytes('Expected a pickled message, got ' + str(raw)[:100] + '\n', 'utf-8')
+            message = msgpack.unpackb(raw, raw=False)
+        except (msgpack.UnpackException, ValueError):
+            response = bytes('Expected a msgpack message, got ' + str(raw)[:100] + '\n', 'utf-8')
         else:
             if message != 'JOIN':
-                response = pickle.dumps('Unexpected message: ' + str(message))
+                response = msgpack.packb('Unexpected message: ' + str(message), use_bin_type=True)
             else:
-                response = pickle.dumps(self.JOIN_RESPONSE)
-        self.request.sendall(response)
+                response = msgpack.packb(self.JOIN_RESPONSE, use_bin_type=True)
+        self.wfile.write(HEADER.pack(len(response)) + response)
 
 
 if __name__ == '__main__':
@@ -8,13 +8,57 @@ from the GDC web service on the 'cs2.seattleu.edu' host. It then sends out
 greetings individual messages to other members in the network, receives
 responses from them, and prints appropriate message to display each peer's response.
 """
-import pickle
 import socket
+import struct
 import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import msgpack
 
 GCD_HOST = 'cs2.seattleu.edu'
 GCD_PORT = 23600
-BUF_SZ = 1024  # tcp receive buffer size
+MAX_GREETERS = 32  # at most this many peers are greeted at the same time
+PEER_TIMEOUT = 2.0  # seconds to wait on an unresponsive peer
+HEADER = struct.Struct('>I')  # 4-byte big-endian length prefix on every message
+
+
+def _set_low_latency(sock):
+    """
+    Disable Nagle so small control messages go out immediately, and turn on keep-alive to notice dead peers.
+    """
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+
+
+def _send_framed(sock, payload):
+    """
+    Send one length-prefixed message. Header and payload go out in a single sendall so they are not split up.
+    """
+    sock.sendall(HEADER.pack(len(payload)) + payload)
+
+
+def _recv_framed(sock):
+    """
+    Read exactly one length-prefixed message, however many TCP reads it takes.
+
+    :return: the payload, or None if the other side closed the connection
+    """
+    header = _recv_exactly(sock, HEADER.size)
+    if header is None:
+        return None
+    return _recv_exactly(sock, HEADER.unpack(header)[0])
+
+
+def _recv_exactly(sock, size):
+    buf = bytearray(size)
+    view = memoryview(buf)
+    offset = 0
+    while offset < size:
+        n = sock.recv_into(view[offset:])
+        if not n:
+            return None  # closed mid-message
+        offset += n
+    return buf
 
 
 class Lab1Server:
@@ -26,16 +70,22 @@ class Lab1Server:
         peers in the network called `nodesData` from it and returns it to the caller.
         """
         with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as server:
+            _set_low_latency(server)
             server.settimeout(1500)
             server.connect((GCD_HOST, GCD_PORT))
             try:
-                server.sendall(pickle.dumps('JOIN'))
-                raw = server.recv(BUF_SZ)
-                nodesData = pickle.loads(raw)
-            except (pickle.PickleError, KeyError):
-                response = bytes('Expected a pickled message, got ' + str(raw)[:100] + '\n', 'utf-8')
+                _send_framed(server, msgpack.packb('JOIN', use_bin_type=True))
+                raw = _recv_framed(server)
+                if raw is None:
+                    print('Connection closed by the GCD before a reply.')
+                    return []
+                nodesData = msgpack.unpackb(raw, raw=False)
+            except (msgpack.UnpackException, ValueError):
+                print('Error Happened! Expected a msgpack message, got', str(raw)[:100])
+                nodesData = []
             except Exception as e:
                 print(e)
+                nodesData = []
             print('Received', repr(nodesData))
             return nodesData
 
@@ -43,29 +93,43 @@ class Lab1Server:
     def greetWithPeers(nodesData):
         """
         This method will be called after asking other peers addresses from the GDC
-        server. It gets the `nodesData` as an input and sends a "Hello" message for
-        each host in the list. It then prints the result based on the responses of the peers.
+        server. It gets the `nodesData` as an input and sends a "Hello" message to
+        all hosts in the list in parallel, so one slow peer does not hold up the others.
+        It then prints the result based on the responses of the peers.
+        """
+        if not nodesData:
+            return
+        with ThreadPoolExecutor(max_workers=min(MAX_GREETERS, len(nodesData))) as executor:
+            list(executor.map(Lab1Server.greetPeer, nodesData))
+
+    @staticmethod
+    def greetPeer(peer):
+        """
+        Sends a "Hello" message to a single peer and prints its response.
         """
-        for peer in nodesData:
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as server:
-                server.settimeout(1500)
-                try:
-                    server.connect((peer['host'], peer['port']))
-                    request = pickle.dumps('HELLO')
-                    server.sendall(request)
-                    raw = server.recv(BUF_SZ)
-                except socket.timeout:
-                    print('Connection to {} timed out.'.format(peer['host']))
-                    continue
-                except Exception as e:
-                    print(str(e) + '! Host: {}, Port: {}'.format(peer['host'], peer['port']))
-                    continue
-                try:
-                    response = pickle.loads(raw)
-                    print('Received', repr(response))
-                except (pickle.PickleError, KeyError):
-                    response = bytes('Expected a pickled message, got ' + str(raw)[:100] + '\n', 'utf-8')
-                    print('Error Happened!', repr(response))
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as server:
+            _set_low_latency(server)
+            server.settimeout(PEER_TIMEOUT)
+            try:
+                server.connect((peer['host'], peer['port']))
+                request = msgpack.packb('HELLO', use_bin_type=True)
+                _send_framed(server, request)
+                raw = _recv_framed(server)
+            except socket.timeout:
+                print('Connection to {} timed out.'.format(peer['host']))
+                return
+            except Exception as e:
+                print(str(e) + '! Host: {}, Port: {}'.format(peer['host'], peer['port']))
+                return
+            if raw is None:
+                print('Connection closed by {} before a reply.'.format(peer['host']))
+                return
+            try:
+                response = msgpack.unpackb(raw, raw=False)
+                print('Received', repr(response))
+            except (msgpack.UnpackException, ValueError):
+                response = bytes('Expected a msgpack message, got ' + str(raw)[:100] + '\n', 'utf-8')
+                print('Error Happened!', repr(response))
 
 
 if __name__ == '__main__':
@@ -4,12 +4,14 @@ This is free and unencumbered software released into the public domain.
 :Authors: Kevin Lundeen
 :Version: f19-02
 """
+import functools
 import pickle
 import socket
 import socketserver
 import sys
 
 BUF_SZ = 1024  # tcp receive buffer size
+_DUMPS = functools.partial(pickle.dumps, protocol=pickle.HIGHEST_PROTOCOL)
 
 
 class GroupCoordinatorDaemon(socketserver.BaseRequestHandler):
@@ -43,7 +45,7 @@ class GroupCoordinatorDaemon(socketserver.BaseRequestHandler):
                 response_data = self.handle_join(message)
             except ValueError as err:
                 response_data = str(err)
-            response = pickle.dumps(response_data)
+            response = _DUMPS(response_data)
         self.request.sendall(response)
         self.request.shutdown(socket.SHUT_RDWR)
         self.request.close()
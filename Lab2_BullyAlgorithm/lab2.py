@@ -20,20 +20,70 @@ are ready to write a message to. The SEND_OK state says I’ve gotten an ELECTIO
 from that peer and so I need to send along an OK response. When the selector returns this
 socket saying it is ready to write, I’ll send it.
 """
+import functools
+import heapq
+import itertools
+import logging
 import pickle
-import selectors
+import random
+import select
 import socket
+import statistics
+import struct
 import sys
+import time
+from collections import deque
 from datetime import datetime
-from enum import Enum
-from typing import Dict
-
-ASSUME_FAILURE_TIMEOUT = 10  # 10 seconds
-CHECK_INTERVAL = 5  # 5 seconds
+from enum import Enum, IntEnum
+from typing import Deque, Dict, List, Optional, Tuple, Union
+
+import msgpack
+
+ASSUME_FAILURE_TIMEOUT = 10.0  # 10 seconds, upper bound of the tuned timeout (and its value until anything is measured)
+CHECK_INTERVAL = 5.0  # 5 seconds
+VICTOR_TIMEOUT = 2 * ASSUME_FAILURE_TIMEOUT + CHECK_INTERVAL  # the winner may sit out two OK timeouts (highest, all)
+MIN_FAILURE_TIMEOUT = 1.0  # never assume failure sooner than 1 second
+BROADCAST_TIME_FACTOR = 10  # timeout is this many measured broadcast times
+FAILURE_TIMEOUT_JITTER = 0.25  # each node adds up to 25% of random jitter so timeouts don't fire in lockstep
+PING_TIMEOUT = 1.0  # seconds allowed for each startup ping
+RTT_GAIN = 0.125  # weight of a new round trip in the mean estimate (same as TCP's RTO)
+RTT_DEV_GAIN = 0.25  # weight of a new round trip in the deviation estimate
+BROADCAST_ELECTION = False  # True sends every ELECTION to all higher peers, as in the original Bully algorithm
 BUF_SZ = 1024  # tcp receive buffer size
+RX_BUF_SZ = 65536  # initial size of each peer's receive buffer (grown for larger messages)
 PEER_DIGITS = 4
 GCD_HOST = 'localhost'
 GCD_PORT = 23203
+LOG_FORMAT = '%(asctime)s.%(msecs)03d %(message)s'
+_DUMPS = functools.partial(pickle.dumps, protocol=pickle.HIGHEST_PROTOCOL)  # the GCD still speaks pickle
+
+logger = logging.getLogger(__name__)
+HEADER = struct.Struct('>I')  # 4-byte big-endian length prefix on every peer message
+
+# We drive epoll (or poll where epoll is unavailable) directly rather than through selectors. Any bit other than
+# "writable" (input, hang-up, error) means there is something to read, as in selectors' own EpollSelector.
+HAS_EPOLL = hasattr(select, 'epoll')
+EVENT_READ = select.EPOLLIN if HAS_EPOLL else select.POLLIN
+EVENT_WRITE = select.EPOLLOUT if HAS_EPOLL else select.POLLOUT
+_NOT_EVENT_WRITE = ~EVENT_WRITE
+
+# typing.Tuple and friends rather than tuple[...], so the annotations still load on python3.6
+Pid = Tuple[int, int]  # (days until the next birthday, SU ID)
+Address = Tuple[str, int]
+Member = Tuple[Pid, Address]
+Peer = socket.socket
+PeerOrSelf = Union[socket.socket, 'Lab2']  # the Lab2 object itself stands for "me" in the states dictionary
+Timestamp = float  # time.monotonic()
+Status = Tuple['State', Timestamp]
+Message = Tuple[str, Dict[Pid, Address]]  # (message name, sender's membership)
+
+
+def _set_low_latency(sock: socket.socket) -> None:
+    """
+    Disable Nagle so small control messages go out immediately, and turn on keep-alive to notice dead peers.
+    """
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
 
 
 class Reason(Enum):
@@ -45,6 +95,8 @@ class Reason(Enum):
     TIMEOUT_NO_COORDINATOR_RECEIVED = 'COORDINATOR TIMEOUT OCCURRED'  # When I'm waiting to see who is the winner,
     # but I don't get before the timeout.
     GET_ELECTION_MESSAGE = 'A PEER SENT ELECTION TO ME'  # When a peer/a member sent me an ELECTION message
+    TIMEOUT_NO_OK_FROM_HIGHEST = 'HIGHEST PEER DID NOT ANSWER'  # When only the highest peer got my ELECTION and it
+    # didn't send OK before the timeout, so I ask all higher peers
 
     # For the following reasons, the process intends to declare victory:
     TIMEOUT_NO_OK_RECEIVED = 'OK TIMEOUT OCCURRED'  # When the I reached timeout while waiting for peers to
@@ -52,27 +104,37 @@ class Reason(Enum):
     COORDINATOR_MYSELF = 'I HAVE HIGHEST PID'  # When ELECTION is finished and I'm the member with highest pid
 
 
-class State(Enum):
+# Message names on the wire. Kept as plain strings so received names are compared without going through an Enum.
+ELECTION = 'ELECTION'
+COORDINATOR = 'COORDINATOR'
+OK = 'OK'
+
+
+class State(IntEnum):
     """
     Enumeration of states a peer can be in for the Lab2 class.
+    Small ints, so the state comparisons on every message are plain int compares.
     """
-    QUIESCENT = 'QUIESCENT'  # Erase any memory of this peer
+    QUIESCENT = 0  # Erase any memory of this peer
 
     # Outgoing message is pending
-    SEND_ELECTION = 'ELECTION'
-    SEND_VICTORY = 'COORDINATOR'
-    SEND_OK = 'OK'
-    SEND_PROBE = 'SEND PROBE TO LEADER'
+    SEND_ELECTION = 1
+    SEND_VICTORY = 2
+    SEND_OK = 3
+    SEND_PROBE = 4
 
     # Incoming message is pending
-    WAITING_FOR_OK = 'WAIT_OK'  # When I've sent them an ELECTION message
-    WAITING_FOR_VICTOR = 'WHO IS THE WINNER?'  # This one only applies to myself
-    WAITING_FOR_ANY_MESSAGE = 'WAITING'  # When I've done an accept on their connect to my server
-    WAITING_FOR_PROBE = "WAITING FOR PROBE"
+    WAITING_FOR_OK = 5  # When I've sent them an ELECTION message
+    WAITING_FOR_VICTOR = 6  # This one only applies to myself
+    WAITING_FOR_ANY_MESSAGE = 7  # When I've done an accept on their connect to my server
+    WAITING_FOR_PROBE = 8
 
-    def is_incoming(self):
+    def is_incoming(self) -> bool:
         """Categorization helper."""
-        return self not in (State.SEND_ELECTION, State.SEND_VICTORY, State.SEND_OK)
+        return self < State.SEND_ELECTION or self > State.SEND_OK
+
+
+MESSAGE_FOR_STATE = {State.SEND_ELECTION: ELECTION, State.SEND_VICTORY: COORDINATOR, State.SEND_OK: OK}
 
 
 class Lab2(object):
@@ -80,16 +142,12 @@ class Lab2(object):
     This is a peer or process who join a group of peers, and uses bully algorithm
     to find the leader of the group.
 
-    To make it compatible with python3.6 I commented out types
-    # Pid = tuple[int, int]
-    # Address = tuple[str, int]
-    # members: Dict[Pid, Address]
-    # Peer = socket.socket
-    # Timestamp = datetime
-    # states: Dict[Peer, tuple[State, Timestamp]]
+    Fully annotated (Pid, Address, Peer, ... are defined at the top of the module), so the
+    state machine can be compiled with mypyc: `mypyc --ignore-missing-imports lab2.py`
+    (msgpack ships no type stubs).
     """
 
-    def __init__(self, gcd_address, next_birthday, su_id):
+    def __init__(self, gcd_address: Union[List, Tuple], next_birthday: datetime, su_id: Union[int, str]) -> None:
         """
         This init function ....
         :param gcd_address: the address of GCD server, includes the host and port
@@ -97,257 +155,491 @@ class Lab2(object):
         :param su_id: Seattle University id
         """
         days_to_birthday = (next_birthday - datetime.now()).days
-        self.pid = (days_to_birthday, int(su_id))  # node identity is a pair of (days until the next birthday, SU ID)
-        self.bully = None  # None means election is pending, otherwise this will be pid of the leader
-        self.selector = selectors.DefaultSelector()
+        # node identity is a pair of (days until the next birthday, SU ID)
+        self.pid: Pid = (days_to_birthday, int(su_id))
+        # None means election is pending, otherwise this will be pid of the leader
+        self.bully: Union[Peer, Address, None] = None
+        self.poller = select.epoll() if HAS_EPOLL else select.poll()
+        self._peer_by_fd: Dict[int, Peer] = {}  # socket registered with the poller for each file descriptor
         self.listener, self.listener_address = self.start_a_server()
-        self.selector.register(self.listener, selectors.EVENT_READ, None)
-        self.gcd_address = (gcd_address[0], int(gcd_address[1]))  # is a pair of IP and port of the GCD server
-        self.states = {}  # dictionary with the socket peer as the key and the value is a tuple (Status, timestamp).
-        self.members = {}  # dictionary with the pid of all peers as the key and addresses as the values (same as
+        self.register(self.listener, EVENT_READ)
+        self.gcd_address: Address = (gcd_address[0], int(gcd_address[1]))  # is a pair of IP and port of the GCD server
+        # dictionary with the peer socket's fd as the key and the value is a tuple (Status, timestamp).
+        # Closed peers are dropped, since the kernel reuses their fds.
+        self._states_by_fd: Dict[int, Status] = {}
+        self._self_fd: int = self.listener.fileno()  # my own state is kept under the listener's fd
+        self._rxbuf: Dict[Peer, bytearray] = {}  # receive buffer for each peer socket, reused across reads
+        # number of bytes received but not yet unpacked at the front of each peer's buffer
+        self._rxoff: Dict[Peer, int] = {}
+        # deque of not yet written memoryviews for each peer the socket couldn't take in one go
+        self._txq: Dict[Peer, Deque[memoryview]] = {}
+        # heap of (deadline, seq, state, timestamp) for my own waiting states
+        self._deadlines: List[Tuple[Timestamp, int, State, Timestamp]] = []
+        self._deadline_seq = itertools.count()  # tie-breaker so the heap never has to compare states
+        # framed bytes of each message name for the current membership, see framed()
+        self._frames: Dict[str, memoryview] = {}
+        self._pending_writes: List[Peer] = []  # already-connected peers with a reply to send, flushed after each select
+        # dictionary with the pid of all peers as the key and addresses as the values (same as
         # returned format of JOIN message in gcd)
+        self.members: Dict[Pid, Address] = {}
+        # (pid, address) of members with a higher pid than mine, rebuilt in update_members
+        self._higher_peers: List[Member] = []
+        self._lower_peers: List[Member] = []  # (pid, address) of members with a lower pid than mine
+        self._election_broadcast: bool = BROADCAST_ELECTION  # whether the current election went to all higher peers
+        self._broadcast_mean: Optional[float] = None  # estimated round trip to a member in seconds, None until measured
+        self._broadcast_dev: float = 0.0  # mean deviation of those round trips
+        self._timeout_jitter: float = random.uniform(0, FAILURE_TIMEOUT_JITTER)  # picked once, so it is this node's own
+        self.assume_failure_timeout: float = ASSUME_FAILURE_TIMEOUT
         self.join_group()
+        self.measure_broadcast_time()
+        self.start_election(Reason.JUST_JOINED)
         self.run()
 
-    def run(self):
+    def run(self) -> None:
         while True:
-            events = self.selector.select(
-                CHECK_INTERVAL)  # select function returns a list of tuples, one for each of the sockets
-            for key, mask in events:
-                if key.fileobj == self.listener:
+            events = self.poll(self.next_timeout())  # list of (fd, event mask) pairs, one for each ready socket
+            for fd, mask in events:
+                peer = self._peer_by_fd.get(fd)
+                if peer is None:
+                    continue  # closed while handling an earlier event of this batch
+                if peer is self.listener:
                     self.accept_peer()
-                elif mask & selectors.EVENT_READ:
-                    self.receive_message(key.fileobj)
+                elif mask & _NOT_EVENT_WRITE:
+                    self.receive_message(peer)
                 else:
-                    self.send_message(key.fileobj)
+                    self.send_message(peer)
+            self.flush_pending_writes()
             self.check_timeouts()
 
-    def accept_peer(self):
+    def flush_pending_writes(self) -> None:
+        """
+        Send the replies queued while handling incoming messages. These peers are already connected, so instead of
+        switching their registration to EVENT_WRITE and waiting for another select, we write to them directly.
+        """
+        pending, self._pending_writes = self._pending_writes, []
+        for peer in pending:
+            if peer.fileno() != -1 and self.get_state(peer) == State.SEND_OK:
+                self.send_message(peer)
+
+    def accept_peer(self) -> None:
         """
         Create a peer socket for reading incoming messages
         """
         conn, addr = self.listener.accept()  # Should be ready to read
-        print(f"Accepted connection from {addr}")
+        logger.debug('Accepted connection from %s', addr)
+        _set_low_latency(conn)
         conn.setblocking(False)
-        events = selectors.EVENT_READ
         self.set_state(State.WAITING_FOR_ANY_MESSAGE, conn)
-        self.selector.register(conn, events, None)
+        self.register(conn, EVENT_READ)
 
-    def send_message(self, peer):  # send_message(self, peer: Peer):
+    def send_message(self, peer: Peer) -> None:
         """
         Send the queued message to the given peer (based on its current state)
         :param peer: the socket object that should be used to send the message
         """
         state = self.get_state(peer)
-        print('{}: sending {} [{}]'.format(self.pr_sock(peer), state.value, self.pr_now()))
         try:
-            self.send(peer, state.value, self.members)  # should be ready, but may be a failed connect instead
+            if peer in self._txq:
+                sent = self.flush(peer)  # finish the message the socket only partly took last time
+            else:
+                if logger.isEnabledFor(logging.DEBUG):  # skip building socket names nobody will read
+                    logger.debug('%s: sending %s', self.pr_sock(peer), MESSAGE_FOR_STATE[state])
+                sent = self.send(peer, MESSAGE_FOR_STATE[state])  # may be a failed connect instead
         except ConnectionError as error:
-            print('Connection error occurred in sending the message: ', error)
+            logger.warning('Connection error occurred in sending the message: %s', error)
+            sent = True  # nothing more will go out on this connection
         except Exception as error:
-            print('Error occurred in sending the message: ', error)
+            logger.warning('Error occurred in sending the message: %s', error)
+            sent = True
+        if not sent:
+            # The rest goes out when the socket is writable again; the state only moves on once it all has
+            self.modify(peer, EVENT_WRITE)
+            return
 
         # check to see if we want to wait for response immediately
         if state == State.SEND_ELECTION:
-            self.set_state(State.WAITING_FOR_OK, peer)
-            self.set_state(State.WAITING_FOR_OK)
+            # the peer and I start waiting at the same instant, so both time out together
+            self._set_states({peer: State.WAITING_FOR_OK, self: State.WAITING_FOR_OK})
             # Switch to read and don't close the connection to receive OK response
-            self.selector.modify(peer, selectors.EVENT_READ)
+            self.modify(peer, EVENT_READ)
         else:
             # Nothing more to send or receive for now
             self.set_quiescent(peer)
 
-    def receive_message(self, peer):  # receive_message(self, peer: Peer):
+    def receive_message(self, peer: Peer) -> None:
         """
         Receive the queued message from the given peer (based on its current state)
         :param peer: the socket object of the peer in the group that should be used for receiving the message
         """
-        state = self.get_state(peer)
-        message = self.receive(peer)
-        if not message:
+        try:
+            messages = self.receive(peer)
+        except ConnectionError as error:
+            # e.g. a dead member refused our connect; its wait for OK just runs into the timeout
+            logger.debug('Connection error occurred in receiving the message: %s', error)
+            messages = None
+        if messages is None:
             # peer closed their connection
-            print('Unregister {}. No messages was received. [{}]'.format(self.pr_sock(peer), self.pr_now()))
-            self.selector.unregister(peer)
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug('Unregister %s. No messages was received.', self.pr_sock(peer))
+            self._states_by_fd.pop(peer.fileno(), None)
+            self.unregister(peer)
+            self.discard_buffers(peer)
             peer.close()
             return
-        message_name, their_members = message
-        print('{}: received {} [{}]'.format(self.pr_sock(peer), message_name, self.pr_now()))
-        if (state == State.WAITING_FOR_OK) and (message_name == State.SEND_OK.value):
+        for message_name, their_members in messages:
+            self.handle_message(peer, message_name, their_members)
+            if peer.fileno() == -1:
+                break  # handling the message closed this connection
+
+    def handle_message(self, peer: Peer, message_name: str, their_members: Dict[Pid, Address]) -> None:
+        """
+        Act on one message received from the given peer (based on its current state)
+        :param peer: the socket object the message came in on
+        :param message_name: the message name, e.g. ELECTION
+        :param their_members: the sender's membership dictionary
+        """
+        state, since = self.get_status(peer)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('%s: received %s', self.pr_sock(peer), message_name)
+        if (state == State.WAITING_FOR_OK) and (message_name == OK):
+            if since is not None:
+                self.observe_round_trip(time.monotonic() - since)  # since is when our ELECTION finished sending
             # wait to see who is the winner:
             self.set_state(state=State.WAITING_FOR_VICTOR)
-            print('Waiting to see who is the winner [{}]'.format(self.pr_now()))
+            logger.info('Waiting to see who is the winner')
             # Nothing more to read or write from this peer
             self.set_quiescent(peer)
-        elif self.get_state() == State.WAITING_FOR_VICTOR and message_name == State.SEND_VICTORY.value:
+        elif self.get_state() == State.WAITING_FOR_VICTOR and message_name == COORDINATOR:
             self.update_members(their_members)
             self.set_leader(peer)
             # Nothing more to do for now with any peer
-            for peer in self.states.keys():
-                self.set_quiescent(peer)
-        elif message_name == State.SEND_ELECTION.value:
+            for fd in list(self._states_by_fd):  # set_quiescent drops the peers it closes
+                self.set_quiescent(self if fd == self._self_fd else self._peer_by_fd[fd])
+        elif message_name == ELECTION:
             # When I receive an ELECTION message, I update the membership list with
             # any members I didn't already know about, then I respond with the text OK.
             # If I am currently in an election, that's all I do.
             # If I am not in an election, then proceed as though I am initiating a new election.
             self.update_members(their_members)
-            # Switch to write and don't close the connection to immediately reply with OK
-            self.selector.modify(peer, selectors.EVENT_WRITE)
+            # Don't close the connection; queue the OK reply to be written right after this select pass
             self.set_state(State.SEND_OK, peer)
+            self._pending_writes.append(peer)
             if not self.is_election_in_progress():
                 self.start_election(Reason.GET_ELECTION_MESSAGE)
-        return
 
-    @classmethod
-    def send(cls, peer, message_name, message_data=None, wait_for_reply=False, buffer_size=BUF_SZ):
-        message = (message_name, message_data)
-        peer.send(pickle.dumps(message))
+    def send(self, peer: Peer, message_name: str) -> bool:
+        """
+        Queue a message with my membership for the peer and write as much as the socket takes now.
+        :return: True if the whole message was written
+        """
+        self._txq.setdefault(peer, deque()).append(self.framed(message_name))
+        return self.flush(peer)
 
-    @staticmethod
-    def receive(peer, buffer_size=BUF_SZ):
-        raw = peer.recv(buffer_size)
-        if not raw:
+    def framed(self, message_name: str) -> memoryview:
+        """
+        The length-prefixed wire bytes of a message carrying my membership. Marshalled once and shared by every
+        peer an election or victory goes out to, until update_members changes the membership.
+        """
+        frame = self._frames.get(message_name)
+        if frame is None:
+            payload = self.pack_message(message_name, self.members)
+            frame = self._frames[message_name] = memoryview(HEADER.pack(len(payload)) + payload)
+        return frame
+
+    def flush(self, peer: Peer) -> bool:
+        """
+        Write the peer's queued bytes until the queue is empty or the non-blocking socket would block.
+        :return: True if nothing is left queued for this peer
+        """
+        queue = self._txq.get(peer)
+        while queue:
+            try:
+                n = peer.send(queue[0])
+            except BlockingIOError:
+                return False
+            if n < len(queue[0]):
+                queue[0] = queue[0][n:]
+                return False
+            queue.popleft()
+        self._txq.pop(peer, None)
+        return True
+
+    def receive(self, peer: Peer) -> Optional[List[Message]]:
+        """
+        Read whatever the peer has sent into its receive buffer and unpack every complete message in it.
+        A partial message is kept at the front of the buffer until the rest of it arrives.
+
+        :param peer: the socket object to read from
+        :return: list of (message_name, members), possibly empty, or None if the peer closed the connection
+        """
+        buf = self._rxbuf.get(peer)
+        if buf is None:
+            buf = self._rxbuf[peer] = bytearray(RX_BUF_SZ)
+        end = self._rxoff.get(peer, 0)
+        n = peer.recv_into(memoryview(buf)[end:])
+        if not n:
             return None
-        return pickle.loads(raw)
+        end += n
+
+        messages = []
+        start = 0
+        with memoryview(buf) as view:
+            while end - start >= HEADER.size:
+                frame_end = start + HEADER.size + HEADER.unpack_from(buf, start)[0]
+                if frame_end > end:
+                    break
+                messages.append(self.unpack_message(view[start + HEADER.size:frame_end]))
+                start = frame_end
+
+        if start == end:
+            end = 0  # everything consumed, so just rewind
+        elif start > 0:
+            buf[:end - start] = buf[start:end]  # move the partial message to the front
+            end -= start
+        if end >= HEADER.size:
+            needed = HEADER.size + HEADER.unpack_from(buf, 0)[0]
+            if needed > len(buf):
+                buf.extend(bytes(needed - len(buf)))
+        self._rxoff[peer] = end
+        return messages
+
+    def discard_buffers(self, peer: Peer) -> None:
+        """Forget the receive buffer and any unsent bytes of a connection that is being closed."""
+        self._rxbuf.pop(peer, None)
+        self._rxoff.pop(peer, None)
+        self._txq.pop(peer, None)
 
-    def check_timeouts(self):
+    @staticmethod
+    def pack_message(message_name: str, members: Optional[Dict[Pid, Address]] = None) -> bytes:
+        """
+        Marshal a peer message with msgpack.
+        msgpack maps cannot have tuple keys, so the members dictionary is sent as a list of [pid, address] pairs.
+
+        :param message_name: the message name, e.g. ELECTION
+        :param members: dictionary of pid -> listener address
+        :return: bytes to send to the peer
+        """
+        pairs = [[list(pid), list(address)] for pid, address in (members or {}).items()]
+        return msgpack.packb([message_name, pairs], use_bin_type=True)
+
+    @staticmethod
+    def unpack_message(raw: Union[bytes, memoryview]) -> Message:
+        """
+        Unmarshal a peer message built by pack_message.
+
+        :param raw: bytes received from the peer
+        :return: (message_name, members) with the members dictionary keyed by pid tuples again
+        """
+        message_name, pairs = msgpack.unpackb(raw, raw=False)
+        return message_name, {tuple(pid): tuple(address) for pid, address in pairs}
+
+    def check_timeouts(self) -> None:
         """
         This function checks if the last message that was sent has not received a response before the timeout period
         """
         if not self.is_election_in_progress():
+            self._deadlines.clear()
             return
 
-        self_state, self_timestamp = self.get_state(detail=True)
-        if self_state == State.WAITING_FOR_VICTOR and self.is_expired(self_timestamp):
-            print('Expired wait for victor, restarting election [{}]'.format(self.pr_now()))
-            self.start_election(Reason.TIMEOUT_NO_COORDINATOR_RECEIVED)
+        # Only my own WAITING_FOR_OK/WAITING_FOR_VICTOR states time out. WAITING_FOR_OK is refreshed with every
+        # ELECTION sent, so once it expires every peer I am waiting on has expired too.
+        now = time.monotonic()
+        while self._deadlines and self._deadlines[0][0] <= now:
+            _, _, state, timestamp = heapq.heappop(self._deadlines)
+            if self._states_by_fd.get(self._self_fd) != (state, timestamp):
+                continue  # superseded by a later state change
+            if state == State.WAITING_FOR_VICTOR:
+                logger.info('Expired wait for victor, restarting election')
+                self.start_election(Reason.TIMEOUT_NO_COORDINATOR_RECEIVED)
+            elif not self._election_broadcast:
+                self.start_election(Reason.TIMEOUT_NO_OK_FROM_HIGHEST, broadcast=True)
+            else:
+                self.declare_victory(Reason.TIMEOUT_NO_OK_RECEIVED)
             return
-        elif self_state == State.WAITING_FOR_VICTOR:
-            print('Unexpired wait for victor, not declaring victory yet [{}]'.format(self.pr_now()))
-            return
-
-        should_declare_victory = True
-        for peer, (state, timestamp) in self.states.items():
-            if peer == self:
-                continue
-            if state == State.WAITING_FOR_OK and not self.is_expired(timestamp):
-                print('Unexpired wait for ok, not declaring victory yet [{}]'.format(self.pr_now()))
-                should_declare_victory = False
 
-        if should_declare_victory:
-            self.declare_victory(Reason.TIMEOUT_NO_OK_RECEIVED)
+        if self.get_state() == State.WAITING_FOR_VICTOR:
+            logger.debug('Unexpired wait for victor, not declaring victory yet')
+        else:
+            logger.debug('Unexpired wait for ok, not declaring victory yet')
 
-    def get_connection(self, member):  # get_connection(self, member: tuple[Pid, Address]):
+    def get_connection(self, member: Member, events: int = EVENT_WRITE) -> Peer:
         """
         Creates a new connection to the specified member using the address (host and port)
+        and registers it with the poller for the given events in one step
         """
         pid, addr = member
         peer = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        _set_low_latency(peer)
         peer.setblocking(False)
         peer.connect_ex(addr)
-        events = selectors.EVENT_WRITE
-        self.selector.register(peer, events)
+        self.register(peer, events)
         return peer
 
-    def is_election_in_progress(self):
-        if self.get_state() == State.WAITING_FOR_OK or self.get_state() == State.WAITING_FOR_VICTOR:
-            return True
-        else:
-            return False
+    def register(self, sock: socket.socket, events: int) -> None:
+        fd = sock.fileno()
+        self.poller.register(fd, events)
+        self._peer_by_fd[fd] = sock
 
-    @staticmethod
-    def is_expired(timestamp: datetime, threshold=ASSUME_FAILURE_TIMEOUT):
-        return (datetime.now() - timestamp).total_seconds() > threshold
+    def modify(self, sock: socket.socket, events: int) -> None:
+        self.poller.modify(sock.fileno(), events)
+
+    def unregister(self, sock: socket.socket) -> None:
+        fd = sock.fileno()
+        self.poller.unregister(fd)
+        del self._peer_by_fd[fd]
+
+    def poll(self, timeout: float) -> List[Tuple[int, int]]:
+        """
+        Wait up to timeout seconds for registered sockets to become ready.
+        :return: list of (fd, event mask) pairs
+        """
+        return self.poller.poll(timeout if HAS_EPOLL else timeout * 1000)  # poll() takes milliseconds
+
+    def next_timeout(self) -> float:
+        """
+        How long the poll may block: until my earliest deadline, and never longer than CHECK_INTERVAL.
+        Deadlines are only armed on this thread, between polls, so no wakeup is needed to shorten a pending one.
+        """
+        if not self._deadlines:
+            return CHECK_INTERVAL
+        return min(CHECK_INTERVAL, max(0.0, self._deadlines[0][0] - time.monotonic()))
 
-    def set_leader(self, new_leader):
+    def is_election_in_progress(self) -> bool:
+        state = self.get_state()
+        return state == State.WAITING_FOR_OK or state == State.WAITING_FOR_VICTOR
+
+    def set_leader(self, new_leader: Union[Peer, Address]) -> None:
         self.bully = new_leader
-        print('Set the leader: leader = {} [{}]'.format(self.pr_leader(), self.pr_now()))
+        logger.info('Set the leader: leader = %s', self.pr_leader())  # LOG_FORMAT already stamps the time
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('Leader set at %s', self.pr_now())  # wall clock to the microsecond, for comparing nodes
 
-    def get_state(self, peer=None, detail=False):
+    def get_state(self, peer: Optional[PeerOrSelf] = None) -> State:
         """
         Look up current state in the state dictionary for a given peer.
 
         :param peer: socket connected to peer process (None means self)
-        :param detail: if True, then the state and timestamp are both returned
-        :return: either the state or (state, timestamp) depending on detail (not found gives (QUIESCENT, None))
+        :return: the state (not found gives QUIESCENT)
+        """
+        return self.get_status(peer)[0]
+
+    def get_status(self, peer: Optional[PeerOrSelf] = None) -> Tuple[State, Optional[Timestamp]]:
+        """
+        Like get_state, but also return when the peer entered that state.
+
+        :param peer: socket connected to peer process (None means self)
+        :return: (state, timestamp) (not found gives (QUIESCENT, None))
         """
-        if peer is None:
-            peer = self
-        status = self.states[peer] if peer in self.states else (State.QUIESCENT, None)
-        return status if detail else status[0]
+        return self._states_by_fd.get(self.state_key(peer), (State.QUIESCENT, None))
+
+    def state_key(self, peer: Optional[PeerOrSelf] = None) -> int:
+        """Key of the given peer (None or self means me) in the states dictionary."""
+        return self._self_fd if peer is None or isinstance(peer, Lab2) else peer.fileno()
 
-    def set_state(self, state, peer=None):
+    def set_state(self, state: State, peer: Optional[PeerOrSelf] = None) -> None:
         """
         Set the state for a given peer in the states dictionary.
-        states dictionary: <key:peer socket object, value: (Status, timestamp)>
+        states dictionary: <key:fd of the peer socket, value: (Status, timestamp)>
 
         :param state: state of this peer
         :param peer: socket object connected to this given peer process (None means self)
         """
-        if peer is None:
-            peer = self
-        self.states[peer] = (state, datetime.now())
+        self._set_states({self if peer is None else peer: state})
+
+    def _set_states(self, states: Dict[PeerOrSelf, State], timestamp: Optional[Timestamp] = None) -> None:
+        """
+        Set several states at once, all stamped with the same timestamp.
+
+        :param states: dictionary with the peer socket (or self) as the key and its new state as the value
+        :param timestamp: time.monotonic() value to stamp them with (None means now)
+        """
+        if timestamp is None:
+            timestamp = time.monotonic()
+        for peer, state in states.items():
+            self._states_by_fd[self.state_key(peer)] = (state, timestamp)
+        mine = states.get(self)
+        if mine == State.WAITING_FOR_OK:
+            deadline = timestamp + self.assume_failure_timeout
+        elif mine == State.WAITING_FOR_VICTOR:
+            deadline = timestamp + VICTOR_TIMEOUT  # the winner's timeouts are its own, not tuned by me
+        else:
+            return
+        heapq.heappush(self._deadlines, (deadline, next(self._deadline_seq), mine, timestamp))
 
-    def set_quiescent(self, peer=None):  # set_quiescent(self, peer: Peer = None):
-        if peer is None:
-            peer = self
-        print('Set {} to QUIESCENT [{}]'.format(self.pr_sock(peer), self.pr_now()))
-        if peer != self:
-            # Close any remaining open connection
-            if self.get_state(peer) != State.QUIESCENT and peer.fileno() != -1:
-                self.selector.unregister(peer)
-                peer.close()
-        self.states[peer] = (State.QUIESCENT, datetime.now())
+    def set_quiescent(self, peer: Optional[PeerOrSelf] = None) -> None:
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('Set %s to QUIESCENT', self.pr_sock(peer))
+        if peer is None or isinstance(peer, Lab2):
+            self._states_by_fd[self._self_fd] = (State.QUIESCENT, time.monotonic())
+            return
+        # Close any remaining open connection; a closed peer has no entry, which reads as QUIESCENT
+        state, _ = self._states_by_fd.pop(peer.fileno(), (State.QUIESCENT, None))
+        if state != State.QUIESCENT and peer.fileno() != -1:
+            self.unregister(peer)
+            peer.close()
+        self.discard_buffers(peer)
 
-    def start_election(self, reason):
+    def start_election(self, reason: Reason, broadcast: bool = BROADCAST_ELECTION) -> None:
         """
         When I first join the group or whenever I notice the leader has failed, I start
-        an election. The ELECTION message is sent to each member with a higher process
-        id than my own pid.  While I am awaiting responses from higher processes, I put
+        an election. While I am awaiting responses from higher processes, I put
         myself in the election-in-progress (waiting for OK) state.
         The ELECTION message is a list of all the current (alive or failed) group members,
         including myself.
-        """
 
-        print('Starting election, reason = {} [{}]'.format(reason.value, self.pr_now()))
-        i_am_highest = True
-        for pid, address in self.members.items():
-            if not self.is_self(pid) and not self.is_higher(pid):
-                peer = self.get_connection((pid, address))
-                self.set_state(State.SEND_ELECTION, peer)
-                i_am_highest = False
+        Following the improved Bully algorithm of Soundarabai et al., the ELECTION message
+        first goes only to the member with the highest pid, which cuts an election from
+        O(N^2) to O(N) messages. If that member doesn't answer before the timeout,
+        check_timeouts calls this again with broadcast=True to send ELECTION to each
+        member with a higher process id than my own pid.
 
-        if i_am_highest:
-            print('Was highest, declaring victory [{}]'.format(self.pr_now()))
+        :param reason: why the election is starting
+        :param broadcast: send to all higher members at once instead of only the highest
+        """
+
+        logger.info('Starting election, reason = %s', reason.value)
+        targets = self._higher_peers
+        if not broadcast and len(targets) > 1:
+            targets = [max(targets)]  # the member with the highest pid
+        self._election_broadcast = len(targets) == len(self._higher_peers)
+        if not self._higher_peers:
+            logger.info('Was highest, declaring victory')
             self.declare_victory(reason.COORDINATOR_MYSELF)
-        else:
-            print('Waiting for OK from higher processes [{}]'.format(self.pr_now()))
-            self.set_state(State.WAITING_FOR_OK)
+            return
+
+        states: Dict[PeerOrSelf, State] = {self.get_connection(member): State.SEND_ELECTION for member in targets}
+        states[self] = State.WAITING_FOR_OK
+        logger.info('Waiting for OK from higher processes')
+        self._set_states(states)
 
-    def declare_victory(self, reason):
+    def declare_victory(self, reason: Reason) -> None:
         # When declaring victory sends a COORDINATOR to everyone.
-        print('Declaring victory, reason = {} [{}]'.format(reason.value, self.pr_now()))
+        logger.info('Declaring victory, reason = %s', reason.value)
         self.set_state(State.QUIESCENT)
         self.set_leader(self.listener.getsockname())
         any_declared_victory_sent = True
-        for member in self.members.items():
-            if self.is_self(member[0]):
-                continue
+        for member in itertools.chain(self._higher_peers, self._lower_peers):
             peer = self.get_connection(member)
             self.set_state(State.SEND_VICTORY, peer)
             any_declared_victory_sent = False
-            print('Declared victory to {} [{}]'.format(self.pr_sock(peer), self.pr_now()))
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug('Declared victory to %s', self.pr_sock(peer))
         if any_declared_victory_sent:
-            print('No members active, no COORDINATION message sent.')
+            logger.info('No members active, no COORDINATION message sent.')
 
-    def update_members(self,
-                       their_idea_of_membership):  # update_members(self, their_idea_of_membership: Dict[Pid, Address]):
+    def update_members(self, their_idea_of_membership: Dict[Pid, Address]) -> None:
         # If I receive a COORDINATOR message, then change my state to not be election-in-progress and update
         # my group membership list as necessary. Note the (possibly) new leader.
         self.members.update(their_idea_of_membership)
-        print('The membership dictionary is updated [{}]'.format(self.pr_now()))
+        self._frames.clear()  # the cached messages carry the old membership
+        # Sort the other members once here, so elections and victory declarations don't rescan and compare pids
+        # (pids are (days, SU ID) tuples, so tuple order is exactly the Bully order)
+        self._higher_peers = [(pid, address) for pid, address in self.members.items() if pid > self.pid]
+        self._lower_peers = [(pid, address) for pid, address in self.members.items() if pid < self.pid]
+        logger.debug('The membership dictionary is updated')
 
     @staticmethod
-    def start_a_server():
+    def start_a_server() -> Tuple[socket.socket, Address]:
         """
         This function sets up the listening socket
         :return: the listener socket, and address of the socket
@@ -357,12 +649,13 @@ class Lab2(object):
         The port number of zero asks the socket library to allocate any free port for you.
         """
         listener_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        _set_low_latency(listener_socket)
         listener_socket.bind(('localhost', 0))
         listener_socket.listen()  # Calling listen() makes a socket ready for accepting connections
         listener_socket.setblocking(False)
         return listener_socket, listener_socket.getsockname()
 
-    def join_group(self):
+    def join_group(self) -> None:
         """
         JOIN the group by talking to the GCD.
         This function uses a blocking socket to communicate with the GCD server, in contrast to
@@ -370,45 +663,85 @@ class Lab2(object):
         running the program
         """
         with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as server:
+            _set_low_latency(server)
             server.settimeout(15)  # 15 seconds
             server.connect(self.gcd_address)
             try:
                 # GCD accepts this join format: ('JOIN', ((days_to_bd, su_id), (host, port)))
                 message_ask_gcd = ('JOIN', (self.pid, self.listener_address))
-                server.sendall(pickle.dumps(message_ask_gcd))
-                raw = server.recv(BUF_SZ)
-                all_peers_listeners = pickle.loads(raw)
-                print('Received from GCD2: ', repr(all_peers_listeners))
-                self.members = all_peers_listeners
+                server.sendall(_DUMPS(message_ask_gcd))
+                # The GCD closes the connection after its reply, so read until EOF; the reply may exceed BUF_SZ
+                buf = bytearray(BUF_SZ)
+                n = 0
+                while True:
+                    if n == len(buf):
+                        buf.extend(bytes(len(buf)))
+                    received = server.recv_into(memoryview(buf)[n:])
+                    if not received:
+                        break
+                    n += received
+                raw = memoryview(buf)[:n]
+                all_peers_listeners = pickle.loads(raw)  # unpickles straight from the buffer
+                logger.info('Received from GCD2: %r', all_peers_listeners)
+                self.update_members(all_peers_listeners)
             except (pickle.PickleError, KeyError):
-                response = bytes('Expected a pickled message, got ' + str(raw)[:100] + '\n', 'utf-8')
-                print(response)
+                response = bytes('Expected a pickled message, got ' + str(bytes(raw[:100])) + '\n', 'utf-8')
+                logger.warning('%s', response)
             except Exception as e:
-                print('An error occurred: ', e)
-
-        self.start_election(Reason.JUST_JOINED)
+                logger.error('An error occurred: %s', e)
 
-    def is_self(self, pid):  # : Pid):
-        return pid == self.pid
+    def measure_broadcast_time(self) -> None:
+        """
+        Ping every member once with a plain TCP connect and tune the failure timeout from the round trips.
+        Members that don't answer are left out, they say nothing about the network.
+        """
+        samples = []
+        for pid, address in itertools.chain(self._higher_peers, self._lower_peers):
+            started = time.monotonic()
+            try:
+                with socket.create_connection(address, timeout=PING_TIMEOUT):
+                    samples.append(time.monotonic() - started)
+            except OSError:
+                continue
+        if samples:
+            self._broadcast_mean = statistics.mean(samples)
+            self._broadcast_dev = statistics.pstdev(samples)
+            logger.info('Broadcast time: min = %.6f, mean = %.6f, stddev = %.6f',
+                        min(samples), self._broadcast_mean, self._broadcast_dev)
+        self.tune_failure_timeout()
+
+    def observe_round_trip(self, rtt: float) -> None:
+        """
+        Fold one ELECTION-to-OK round trip into the broadcast time estimate (slow moving averages, as TCP does).
+        :param rtt: seconds between sending ELECTION and receiving its OK
+        """
+        if self._broadcast_mean is None:
+            self._broadcast_mean, self._broadcast_dev = rtt, rtt / 2
+        else:
+            self._broadcast_dev += RTT_DEV_GAIN * (abs(rtt - self._broadcast_mean) - self._broadcast_dev)
+            self._broadcast_mean += RTT_GAIN * (rtt - self._broadcast_mean)
+        self.tune_failure_timeout()
 
-    def is_higher(self, pid):  # : Pid):
-        if (self.pid[0] > pid[0]) or (self.pid[0] == pid[0] and self.pid[1] > pid[1]):
-            return True
-        return False
+    def tune_failure_timeout(self) -> None:
+        if self._broadcast_mean is None:
+            return  # nothing measured yet, keep the previous timeout
+        base = max(MIN_FAILURE_TIMEOUT, BROADCAST_TIME_FACTOR * self._broadcast_mean + 5 * self._broadcast_dev)
+        self.assume_failure_timeout = min(ASSUME_FAILURE_TIMEOUT, base * (1 + self._timeout_jitter))
+        logger.debug('Failure timeout tuned to %.3f seconds', self.assume_failure_timeout)
 
     @staticmethod
-    def pr_now():
+    def pr_now() -> str:
         """Printing helper for current timestamp."""
         return datetime.now().strftime('%H:%M:%S.%f')
 
-    def pr_sock(self, sock):
+    def pr_sock(self, sock: Optional[PeerOrSelf]) -> str:
         """Printing helper for given socket."""
-        if sock is None or sock == self or sock == self.listener:
+        if sock is None or isinstance(sock, Lab2) or sock == self.listener:
             return 'self'
         return self.cpr_sock(sock)
 
     @staticmethod
-    def cpr_sock(sock):
+    def cpr_sock(sock: socket.socket) -> str:
         """Static version of helper for printing given socket."""
         try:
             l_port = sock.getsockname()[1] % PEER_DIGITS
@@ -420,7 +753,7 @@ class Lab2(object):
             r_port = '???'
         return '{}->{}({})'.format(l_port, r_port, id(sock))
 
-    def pr_leader(self):
+    def pr_leader(self) -> Union[str, Peer, Address]:
         """Printing helper for current leader's name."""
         return 'unknown' if self.bully is None else ('self' if self.bully == self.pid else self.bully)
 
@@ -432,6 +765,7 @@ if __name__ == '__main__':
         su_id = args[1]
     else:
         birthday = datetime(2023, 5, 19)
-        su_id = 9120032
-    print(f'{birthday}, {su_id}')
+        su_id = '9120032'
+    logging.basicConfig(format=LOG_FORMAT, datefmt='%H:%M:%S', level=logging.INFO)
+    logger.info('%s, %s', birthday, su_id)
     node_one = Lab2(gcd_address=[GCD_HOST, GCD_PORT], next_birthday=birthday, su_id=su_id)
@@ -10,6 +10,8 @@ class Reason(Enum):
     TIMEOUT_NO_COORDINATOR_RECEIVED = 'COORDINATOR TIMEOUT OCCURRED'  # When I'm waiting to see who is the winner,
     # but I don't get before the timeout.
     GET_ELECTION_MESSAGE = 'A PEER SENT ELECTION TO ME'  # When a peer/a member sent me an ELECTION message
+    TIMEOUT_NO_OK_FROM_HIGHEST = 'HIGHEST PEER DID NOT ANSWER'  # When only the highest peer got my ELECTION and it
+    # didn't send OK before the timeout, so I ask all higher peers
 
     # For the following reasons, the process intends to declare victory:
     TIMEOUT_NO_OK_RECEIVED = 'OK TIMEOUT OCCURRED'  # When the I reached timeout while waiting for peers to
@@ -1,25 +1,32 @@
-from enum import Enum
+from enum import IntEnum
 
 
-class State(Enum):
+# Message names on the wire. Kept as plain strings so received names are compared without going through an Enum.
+ELECTION = 'ELECTION'
+COORDINATOR = 'COORDINATOR'
+OK = 'OK'
+
+
+class State(IntEnum):
     """
     Enumeration of states a peer can be in for the Lab2 class.
+    Small ints, so the state comparisons on every message are plain int compares.
     """
-    QUIESCENT = 'QUIESCENT'  # Erase any memory of this peer
+    QUIESCENT = 0  # Erase any memory of this peer
 
     # Outgoing message is pending
-    SEND_ELECTION = 'ELECTION'
-    SEND_VICTORY = 'COORDINATOR'
-    SEND_OK = 'OK'
-    SEND_PROBE = 'SEND PROBE TO LEADER'
+    SEND_ELECTION = 1
+    SEND_VICTORY = 2
+    SEND_OK = 3
+    SEND_PROBE = 4
 
     # Incoming message is pending
-    WAITING_FOR_OK = 'WAIT_OK'  # When I've sent them an ELECTION message
-    WAITING_FOR_VICTOR = 'WHO IS THE WINNER?'  # This one only applies to myself
-    WAITING_FOR_ANY_MESSAGE = 'WAITING'  # When I've done an accept on their connect to my server
-    WAITING_FOR_PROBE = "WAITING FOR PROBE"
+    WAITING_FOR_OK = 5  # When I've sent them an ELECTION message
+    WAITING_FOR_VICTOR = 6  # This one only applies to myself
+    WAITING_FOR_ANY_MESSAGE = 7  # When I've done an accept on their connect to my server
+    WAITING_FOR_PROBE = 8
 
     def is_incoming(self):
         """Categorization helper."""
-        return self not in (State.SEND_ELECTION, State.SEND_VICTORY, State.SEND_OK)
+        return self < State.SEND_ELECTION or self > State.SEND_OK
 
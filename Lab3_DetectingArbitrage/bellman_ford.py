@@ -1,8 +1,11 @@
 """
 The Bellman-Ford algorithm
 """
+from collections import deque
 from datetime import datetime
 
+INF = float('inf')  # bound once, instead of building float('Inf') for every comparison
+
 
 def initialize(graph, start_vertex):
     """
@@ -17,21 +20,13 @@ def initialize(graph, start_vertex):
     # from start_vertex to that vertex
     prev = {}  # predecessor: dictionary keyed by vertex of previous vertex in shortest path from start_vertex
     for node in graph:
-        dist[node] = float('Inf')  # distances from the source to all vertices (including the source itself)
+        dist[node] = INF  # distances from the source to all vertices (including the source itself)
         # are set as infinite
         prev[node] = None  # at the beginning we don't know the predecessor of nodes in the shortest path
     dist[start_vertex] = 0  # distance to the start vertex is zero
     return dist, prev
 
 
-def relax(node, neighbour, graph, d, p, tolerance):
-    # If the distance between the node and the neighbour is lower than the one I have now, update
-    # my distance to this lower distance
-    if d[node] != float('Inf') and d[neighbour] + tolerance > d[node] + graph[node][neighbour][0]:
-        d[neighbour] = d[node] + graph[node][neighbour][0]
-        p[neighbour] = node
-
-
 def bellman_ford(graph, start_vertex, tolerance=0):
     """
     This function run the Bellman Ford algorithm to find the shortest path from start_vertex
@@ -49,25 +44,66 @@ def bellman_ford(graph, start_vertex, tolerance=0):
     :return: the distance list, previous list, and one of the edges on a negative cycle
     """
     dist, prev = initialize(graph, start_vertex)
+    # Flatten the graph into (u, v, weight) once, instead of walking the dictionaries again on every pass
+    edges = [(u, v, w[0]) for u, neighbours in graph.items() for v, w in neighbours.items()]
     for i in range(len(graph) - 1):
-        for u in graph:
-            for v in graph[u]:  # For each neighbour of u
-                relax(u, v, graph, dist, prev, tolerance)
+        relaxed = False
+        for u, v, w in edges:
+            # If the distance between the node and the neighbour is lower than the one I have now, update
+            # my distance to this lower distance
+            du = dist[u]
+            if du < INF and du + w + tolerance < dist[v]:  # strictly better, by more than tolerance
+                dist[v] = du + w
+                prev[v] = u
+                relaxed = True
+        if not relaxed:
+            break  # distances stopped changing, so further passes would change nothing either (Yen)
 
     # check for negative-weight cycles
     neg_edge = None
-    for u in graph:
-        for v in graph[u]:
-            if dist[u] is not None and dist[v] + tolerance > dist[u] + graph[u][v][0]:
-                # If True, the graph has a negative weight cycle
-                neg_edge = (v, u)
-                break
-        if neg_edge is not None:
+    for u, v, w in edges:
+        if dist[u] < INF and dist[u] + w + tolerance < dist[v]:
+            # If True, the graph has a negative weight cycle
+            neg_edge = (v, u)
             break
 
     return dist, prev, neg_edge
 
 
+def spfa(graph, start_vertex, tolerance=0):
+    """
+    The Shortest Path Faster Algorithm: Bellman-Ford that only relaxes the edges out of vertices whose distance
+    changed, kept in a FIFO queue. On sparse graphs where few distances change this is close to one pass over
+    the edges instead of len(graph) - 1 of them.
+
+    :param graph: same as for bellman_ford
+    :param start_vertex: source of the shortest path
+    :param tolerance: same as for bellman_ford
+    :return: the distance list, previous list, and one of the edges on a negative cycle, as bellman_ford does.
+    As soon as the path to a vertex would need len(graph) edges it must go around a negative cycle, so that edge
+    is returned right away instead of after a separate check.
+    """
+    dist, prev = initialize(graph, start_vertex)
+    hops = {start_vertex: 0}  # number of edges on the path to each vertex
+    queue = deque([start_vertex])
+    queued = {start_vertex}
+    while queue:
+        u = queue.popleft()
+        queued.discard(u)
+        du = dist[u]
+        for v, (w, _) in graph.get(u, {}).items():
+            if du + w + tolerance < dist[v]:  # the same relaxation as in bellman_ford
+                dist[v] = du + w
+                prev[v] = u
+                hops[v] = hops[u] + 1
+                if hops[v] >= len(graph):
+                    return dist, prev, (v, u)
+                if v not in queued:
+                    queue.append(v)
+                    queued.add(v)
+    return dist, prev, None
+
+
 # def shortest_paths(start_vertex, tolerance=0):
 #     """
 #     Find the shortest paths (sum of edge weights) from start_vertex to every other vertex.
@@ -101,17 +137,26 @@ def bellman_ford(graph, start_vertex, tolerance=0):
 #     """
 
 def find_negative_cycle(graph, vertex, prev):
-    graph_vertices = list(graph.keys())
-    for i in range(len(graph_vertices)):
-        vertex = prev[vertex]
-    cycle = []
+    """
+    Follow the predecessors back from a vertex until one repeats; the vertices from its first visit on are the
+    cycle. One pass, and it stops after at most len(graph) steps whatever prev holds.
+
+    :param graph: the graph prev was found for
+    :param vertex: a vertex on, or reached from, a negative cycle
+    :param prev: predecessor of each vertex, None or -1 where there is none
+    :return: the cycle in exchange order, starting and ending with the same vertex, or None if following prev
+    from vertex doesn't go around one
+    """
+    seen = []
+    idx = {}  # vertex -> its position in seen
     v = vertex
-    while True:
-        cycle.append(v)
-        if v == vertex and len(cycle) > 1:
-            break
+    while v not in idx:
+        if v is None or v == -1:
+            return None
+        idx[v] = len(seen)
+        seen.append(v)
         v = prev[v]
-
+    cycle = seen[idx[v]:] + [v]
     cycle.reverse()
     return cycle
 
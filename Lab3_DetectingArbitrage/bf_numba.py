@@ -0,0 +1,121 @@
+"""
+The Bellman-Ford algorithm over a graph in CSR (compressed sparse row) form, compiled with Numba
+"""
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError:  # without Numba the same kernel still runs, only as plain Python
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda function: function
+
+INF = np.inf
+
+
+@njit(cache=True)
+def bellman_ford_csr(indptr, indices, weights, n, src, tol):
+    """
+    This function runs the Bellman Ford algorithm to find the shortest paths from src. Vertices are the
+    integers 0 to n - 1, and the edges out of vertex u are the entries indptr[u] to indptr[u + 1] of indices
+    (their destination vertices) and weights (their weights).
+
+    :param indptr: int32 array of n + 1 offsets into indices and weights
+    :param indices: int32 array with the destination vertex of each edge
+    :param weights: float64 array with the weight of each edge
+    :param n: number of vertices
+    :param src: source of the shortest paths
+    :param tol: only relaxations resulting in an improvement greater than tol are considered, for negative cycle
+    detection too
+    :return: the distance array, the previous array (-1 where there is no predecessor), and the two ends (v, u)
+    of an edge u -> v on a negative cycle, (-1, -1) if there is none
+    """
+    dist = np.full(n, INF)
+    prev = np.full(n, -1, dtype=np.int32)
+    dist[src] = 0.0
+    for _ in range(n - 1):
+        relaxed = False
+        for u in range(n):
+            du = dist[u]
+            if du == INF:
+                continue
+            for k in range(indptr[u], indptr[u + 1]):
+                v = indices[k]
+                nd = du + weights[k]
+                if nd + tol < dist[v]:
+                    dist[v] = nd
+                    prev[v] = u
+                    relaxed = True
+        if not relaxed:
+            break  # converged, every later pass would be the same (Yen's early exit)
+
+    # check for negative-weight cycles: an edge that can still be relaxed after n - 1 passes is on one
+    for u in range(n):
+        du = dist[u]
+        if du == INF:
+            continue
+        for k in range(indptr[u], indptr[u + 1]):
+            v = indices[k]
+            if du + weights[k] + tol < dist[v]:
+                return dist, prev, np.int64(v), np.int64(u)
+    return dist, prev, np.int64(-1), np.int64(-1)
+
+
+@njit(cache=True)
+def spfa_csr(indptr, indices, weights, n, src, tol):
+    """
+    The Shortest Path Faster Algorithm, a Bellman-Ford that only relaxes the edges out of vertices whose distance
+    changed, kept in a FIFO queue. Same graph, parameters and result as bellman_ford_csr.
+    """
+    dist = np.full(n, INF)
+    prev = np.full(n, -1, dtype=np.int32)
+    hops = np.zeros(n, dtype=np.int32)
+    dist[src] = 0.0
+    neg_v, neg_u = spfa_seeded(indptr, indices, weights, n, tol, dist, prev, hops, np.array([src], dtype=np.int32))
+    return dist, prev, neg_v, neg_u
+
+
+@njit(cache=True)
+def spfa_seeded(indptr, indices, weights, n, tol, dist, prev, hops, seeds):
+    """
+    SPFA continued from the given distances, which it updates in place, with only the seeds in the queue at first.
+    Starting from src alone with every other distance inf is a full run; starting from an earlier solution and the
+    vertices whose edges changed since then only walks what those changes affect.
+
+    There is no separate cycle check: a shortest path has fewer than n edges, so as soon as the path to a vertex
+    would need n of them, it goes around a negative cycle and that last edge is returned.
+
+    :param dist: float64 distance array
+    :param prev: int32 previous array, -1 where there is no predecessor
+    :param hops: int32 number of edges on the path to each vertex
+    :param seeds: int32 array of distinct vertices whose out edges have to be relaxed
+    :return: the two ends (v, u) of an edge u -> v on a negative cycle, (-1, -1) if there is none
+    """
+    queue = np.empty(n, dtype=np.int32)  # circular FIFO; no vertex is in it twice, so n slots are enough
+    queued = np.zeros(n, dtype=np.bool_)
+    for s in seeds:
+        queued[s] = True
+    size = len(seeds)
+    queue[:size] = seeds
+    head = 0
+    while size > 0:
+        u = queue[head]
+        head = (head + 1) % n
+        size -= 1
+        queued[u] = False
+        du = dist[u]
+        for k in range(indptr[u], indptr[u + 1]):
+            v = indices[k]
+            nd = du + weights[k]
+            if nd + tol < dist[v]:
+                dist[v] = nd
+                prev[v] = u
+                hops[v] = hops[u] + 1
+                if hops[v] >= n:
+                    return np.int64(v), np.int64(u)
+                if not queued[v]:
+                    queue[(head + size) % n] = v
+                    size += 1
+                    queued[v] = True
+    return np.int64(-1), np.int64(-1)
@@ -3,12 +3,19 @@ Subscriber of a Forex Provider
 
 This module contains useful unmarshalling functions for subscriber.
 """
-import ipaddress
-from array import array
+import socket
+import struct
 from datetime import datetime, timezone
 
+import numpy as np
+
 MAX_QUOTES_PER_MESSAGE = 50
 MICROS_PER_SECOND = 1_000_000
+# One 32-byte quote record: big-endian microseconds timestamp, the two currencies, the price as sent by the
+# provider (a little-endian double) and 10 reserved bytes
+QUOTE_RECORD = np.dtype([('timestamp', '>u8'), ('first_cross', 'S3'), ('second_cross', 'S3'), ('price', '<f8'),
+                         ('reserved', 'V10')])
+_unpack_price = struct.Struct('<d').unpack_from  # the provider's serialize_price writes a little-endian double
 
 
 def deserialize_price(x: bytes) -> float:
@@ -18,53 +25,55 @@ def deserialize_price(x: bytes) -> float:
     :param x: price received from Forex Provider message in byte array format
     :return: number in float format
     """
-    return array('d', x)[0]
+    return _unpack_price(x)[0]
 
 
 def serialize_address(socket_address: (str, int)) -> bytes:
     """
+    Convert a socket address into the 6 bytes the subscription request carries: the IPv4 address followed by the
+    port, both in big-endian network format.
 
     :param socket_address: a tuple of ip address and port
     :return: 6-byte stream
     """
-    address = bytes()
-    ip_v4 = ipaddress.ip_address(socket_address[0])
-    ip_v4_as_int = int(ip_v4)
-    address += ip_v4_as_int.to_bytes(4, byteorder="big")
-    port_byte_array = int(socket_address[1]).to_bytes(2, byteorder='big')  # array of 2-byte
-    address += port_byte_array
-    return address
+    return socket.inet_aton(socket_address[0]) + struct.pack('!H', socket_address[1])
 
 
-def deserialize_utc_datetime(utc_byte: bytes):
+def deserialize_utc_micros(utc_byte: bytes) -> int:
     """
-    Convert a byte stream of UTC datetime into datetime from a Forex Provider message.
+    Convert a byte stream of UTC datetime from a Forex Provider message into microseconds.
     A 64-bit integer number of microseconds that have passed since 00:00:00 UTC on 1 January 1970
     (excluding leap seconds). Sent in big-endian network format.
 
-    :param utc_byte: byte stream to convert to datetime timestamp
-    :return: 8-byte stream
+    :param utc_byte: 8-byte stream to convert
+    :return: microseconds since the epoch
+    """
+    return int.from_bytes(utc_byte, "big")
+
+
+def micros_to_datetime(utc_micros: int) -> datetime:
+    """
+    Convert microseconds since the epoch into a UTC datetime, for printing.
     """
-    utc_val = int.from_bytes(utc_byte, "big")
-    date_utc = datetime.fromtimestamp(utc_val / MICROS_PER_SECOND, timezone.utc)
-    return date_utc
+    return datetime.fromtimestamp(utc_micros / MICROS_PER_SECOND, timezone.utc)
 
 
 def unmarshal_message(quote_byte_stream: bytes):
     """
     Construct the message in a list format from forex provider from received byte stream.
 
-    :param quote_byte_stream: list of quote structures ('cross' and 'price', may also have 'timestamp')
-    :return: byte stream to send in UDP message
+    :param quote_byte_stream: byte stream received in a UDP message
+    :return: list of quote structures, 'timestamp' (microseconds since the epoch), 'src' and 'dst' (the two
+    currencies of the cross) and 'price'
     """
+    quotes_count = len(quote_byte_stream) // QUOTE_RECORD.itemsize
+    records = np.frombuffer(quote_byte_stream, dtype=QUOTE_RECORD, count=quotes_count)  # all fields, no copying
     message = []
-    quotes_count = int(len(quote_byte_stream) / 32)
-    for i in range(quotes_count):
-        offset = i * 32
-        timestamp = deserialize_utc_datetime(quote_byte_stream[0 + offset:8 + offset])
-        first_cross = quote_byte_stream[8 + offset:11 + offset].decode()
-        second_cross = quote_byte_stream[11 + offset:14 + offset].decode()
-        price = deserialize_price(quote_byte_stream[14 + offset:22 + offset])
-        message.append({'timestamp': timestamp, 'cross': '{}/{}'.format(first_cross, second_cross), 'price': price})
+    for timestamp, first_cross, second_cross, price in zip(records['timestamp'].astype(np.int64).tolist(),
+                                                           records['first_cross'].tolist(),
+                                                           records['second_cross'].tolist(),
+                                                           records['price'].tolist()):
+        message.append({'timestamp': timestamp, 'src': first_cross.decode(), 'dst': second_cross.decode(),
+                        'price': price})
 
     return message
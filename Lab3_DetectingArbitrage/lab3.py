@@ -8,17 +8,29 @@ The format of the published message is a series of 1 to 50 of the following 32-b
     [22, 32) ---> Reserved! These are not currently used and set to 0 for now.
 
 """
+import heapq
+import logging
 import math
 import socket
+import time
 
-from bellman_ford import bellman_ford, find_negative_cycle
+import numpy as np
+
+from bellman_ford import find_negative_cycle
+from bf_numba import spfa_seeded
 from fxp_bytes_subscriber import *
 
 STALENESS_TIMEOUT = 1.5  # A published price is assumed to remain in force for 1.5 seconds or until a
 # superseding rate for the same market is observed.
+STALENESS_MICROS = int(STALENESS_TIMEOUT * 1_000_000)  # the same, in the microseconds quotes are stamped with
 SUBSCRIPTION_DURATION = 600  # Subscriptions last for 10 minutes
 
-TOLERANCE = 0
+RECEIVE_BUFFER_SIZE = 4096  # more than the largest message, MAX_QUOTES_PER_MESSAGE records of 32 bytes
+TOLERANCE = 1e-12  # ignore cycles whose gain is only floating-point noise, e.g. buying and selling back a quote
+INITIAL_CURRENCIES = 8  # starting size of the rate matrices, doubled whenever another currency doesn't fit
+LOG_FORMAT = '%(asctime)s.%(msecs)03d %(message)s'
+
+logger = logging.getLogger(__name__)
 
 
 class Subscriber(object):
@@ -29,9 +41,22 @@ class Subscriber(object):
         3- run Bellman-Ford, and
         4- report any arbitrage opportunities.
         """
-        self.start_time = datetime.now()
+        self.start_time = time.monotonic()
         self.latest_received_price = None
-        self.graph = {}
+        # The graph is kept as parallel arrays indexed by currency number: rates[i, j] is the weight (-log of the
+        # price) of exchanging currency i for currency j, or inf while there is no quote in force for that market,
+        # and ts[i, j] is the timestamp of that quote in microseconds since the epoch.
+        self.currency_idx = {}  # currency -> its row and column in the arrays
+        self.currencies = []  # currency of each row and column
+        self.rates = np.full((INITIAL_CURRENCIES, INITIAL_CURRENCIES), np.inf)
+        self.ts = np.zeros((INITIAL_CURRENCIES, INITIAL_CURRENCIES), dtype=np.int64)
+        self.expiry_heap = []  # (timestamp, i, j) of each quote applied, the oldest first, to find the stale ones
+        # The last shortest paths found, kept to start the next run from: distance, predecessor and number of
+        # edges on the path to each currency, the source they were found from and the rates they were found for
+        # (None when they can't be reused, e.g. after a negative cycle)
+        self.prev_dist = self.prev_prev = self.prev_hops = None
+        self.prev_src = None
+        self.prev_rates = None
         self.subscribe()
 
     def subscribe(self):
@@ -39,93 +64,192 @@ class Subscriber(object):
         forex_publisher_address = ('localhost', 43122)
         # You subscribe or renew your subscriptions to the price feed by sending your listening
         # IP address and port number to the forex provider process
-        print('starting up on {} port {}'.format(*listener_address))
+        logger.info('starting up on %s port %s', *listener_address)
 
         is_subscribed = False
 
         # Create a UDP socket
+        buffer = memoryview(bytearray(RECEIVE_BUFFER_SIZE))  # every message is received into this same buffer
         with socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP) as sock:
             sock.bind(listener_address)  # subscriber binds the socket to the publishers address
             while True:
                 if not is_subscribed:
-                    print("Subscribing")
-                    self.send_subscription_request(forex_publisher_address, sock.getsockname())
+                    logger.info("Subscribing")
+                    self.send_subscription_request(sock, forex_publisher_address)
                     is_subscribed = True
-                print('\nblocking, waiting to receive message form forex publisher')
-                data = sock.recv(4096)
-                print('received {} bytes form forex publisher'.format(len(data)))
-                quotes_list = unmarshal_message(
-                    data)  # extract quotes from byte stream that was received from publisher
-                self.update_graph(quotes_list)  # update the graph from based on the publisher response
-                distance, previous, neg_edge = bellman_ford(self.graph, 'USD', TOLERANCE)  # call bellman ford starting
+                logger.debug('blocking, waiting to receive message form forex publisher')
+                data = buffer[:sock.recv_into(buffer)]
+                logger.debug('received %d bytes form forex publisher', len(data))
+                self.ingest_message(data)  # update the graph straight from the byte stream the publisher sent
+                previous, neg_edge = self.run_bellman_ford('USD')  # call bellman ford starting
                 # from USD to find a negative edge
                 if neg_edge is None:
                     continue
-                arbitrage_opportunity = find_negative_cycle(self.graph, neg_edge[1], previous)
-                self.report_arbitrage(
-                    arbitrage_opportunity)
+                arbitrage_opportunity = find_negative_cycle(self.currencies, neg_edge[1], previous)
+                if arbitrage_opportunity is not None:
+                    self.report_arbitrage([self.currencies[i] for i in arbitrage_opportunity])
                 self.check_duration()
 
     def check_duration(self):
-        if (datetime.now() - self.start_time).total_seconds() > SUBSCRIPTION_DURATION:
+        if time.monotonic() - self.start_time > SUBSCRIPTION_DURATION:
             exit()
 
+    def run_bellman_ford(self, start_vertex):
+        """
+        Hand the quotes in force to the compiled Bellman-Ford (SPFA) kernel as CSR arrays, starting from the
+        previous shortest paths where the quotes changed since then allow it.
+
+        :param start_vertex: the source currency of the shortest paths
+        :return: predecessor array and one edge (v, u) on a negative cycle (None if there is none), both by currency
+        number
+        """
+        if start_vertex not in self.currency_idx:
+            return None, None
+        n = len(self.currencies)
+        rates = self.rates[:n, :n]
+        active = np.isfinite(rates)
+        rows, cols = np.nonzero(active)  # row by row, so the edges out of each currency come out together
+        indptr = np.zeros(n + 1, dtype=np.int32)
+        np.cumsum(np.count_nonzero(active, axis=1), out=indptr[1:])
+        seeds = self.warm_start(rates, self.currency_idx[start_vertex])
+        neg_v, neg_u = spfa_seeded(indptr, cols.astype(np.int32), rates[rows, cols], n, TOLERANCE,
+                                   self.prev_dist, self.prev_prev, self.prev_hops, seeds)
+        # paths that went around a negative cycle are no shortest paths to start from next time
+        self.prev_rates = rates.copy() if neg_u < 0 else None
+        return self.prev_prev, (None if neg_u < 0 else (neg_v, neg_u))
+
+    def warm_start(self, rates, src):
+        """
+        Set prev_dist, prev_prev and prev_hops up for the next SPFA run. The previous shortest paths are kept
+        wherever they don't use a quote that has gone up or gone stale since; a currency reached over such a quote,
+        and every currency reached through it, is forgotten and has to be found again.
+
+        :param rates: the rates in force
+        :param src: number of the source currency
+        :return: the currencies to start relaxing from, int32 array
+        """
+        n = len(rates)
+        previous = self.prev_rates
+        if previous is None or len(previous) != n or src != self.prev_src:
+            self.prev_dist = np.full(n, np.inf)
+            self.prev_prev = np.full(n, -1, dtype=np.int32)
+            self.prev_hops = np.zeros(n, dtype=np.int32)
+            self.prev_dist[src] = 0.0
+            self.prev_src = src
+            return np.array([src], dtype=np.int32)
+        dist, prev, hops = self.prev_dist, self.prev_prev, self.prev_hops
+        # a quote going up makes the opposite one go down, so nearly every message raises some edge
+        raised_u, raised_v = np.nonzero(rates > previous)  # inf > rate too, for quotes that went stale
+        forgotten = np.zeros(n, dtype=bool)
+        forgotten[raised_v[prev[raised_v] == raised_u]] = True
+        has_prev = prev >= 0
+        while True:
+            reached_through = has_prev & ~forgotten & forgotten[prev]
+            if not reached_through.any():
+                break
+            forgotten |= reached_through
+        dist[forgotten] = np.inf
+        prev[forgotten] = -1
+        hops[forgotten] = 0
+        # distances can only improve going out of the currencies with a lower quote or a quote into one forgotten
+        seeds = (rates < previous).any(axis=1) | (np.isfinite(rates) & forgotten).any(axis=1)
+        return np.flatnonzero(seeds & (dist < np.inf)).astype(np.int32)
+
+    def currency_index(self, currency):
+        """
+        Row and column of the given currency in the rate arrays, adding it (and growing the arrays) if it is new.
+        """
+        index = self.currency_idx.setdefault(currency, len(self.currencies))  # one probe to find or add it
+        if index == len(self.currencies):
+            self.currencies.append(currency)
+            size = len(self.rates)
+            if index == size:
+                self.rates = np.pad(self.rates, (0, size), constant_values=np.inf)
+                self.ts = np.pad(self.ts, (0, size))
+        return index
+
+    def ingest_message(self, data):
+        """
+        Update the graph from a received message in one pass over its records, without building the list of
+        quote dictionaries that unmarshal_message returns.
+
+        :param data: byte stream received from the forex provider
+        """
+        records = np.frombuffer(data, dtype=QUOTE_RECORD, count=len(data) // QUOTE_RECORD.itemsize)
+        self.apply_quotes(zip(records['timestamp'].astype(np.int64).tolist(),
+                              map(bytes.decode, records['first_cross'].tolist()),
+                              map(bytes.decode, records['second_cross'].tolist()),
+                              records['price'].tolist()))
+
     def update_graph(self, quotes):
-        for item in quotes:
-            timestamp = item['timestamp']
-            source_currency = item['cross'].split('/')[0]
-            destination_currency = item['cross'].split('/')[1]
-            log_rate = -1.0 * math.log10(item['price'])
+        """
+        Update the graph from quotes as unmarshal_message returns them.
+        """
+        self.apply_quotes((item['timestamp'], item['src'], item['dst'], item['price']) for item in quotes)
+
+    def apply_quotes(self, quotes):
+        """
+        :param quotes: iterable of (timestamp in microseconds since the epoch, source currency, destination
+        currency, price)
+        """
+        for timestamp, source_currency, destination_currency, price in quotes:
+            log_rate = -math.log(price)  # any base finds the same cycles, and log saves log10's division
+            i = self.currency_index(source_currency)
+            j = self.currency_index(destination_currency)
             # update this in the graph
-            if self.graph.keys().__contains__(source_currency) and \
-                    self.graph[source_currency].keys().__contains__(destination_currency):
-                latest_timestamp = self.graph[source_currency][destination_currency][1]
-                if timestamp < latest_timestamp:
-                    # Quotes may come out of order since this is UDP/IP, so the process should ignore any
-                    # quotes with timestamps before the latest one seen for that market.
-                    print('ignoring out-of-sequence message \n \t {} {} {}'.format(timestamp, source_currency,
-                                                                                   destination_currency, item['price']))
-                    continue
-            if not self.graph.keys().__contains__(source_currency):
-                self.graph[source_currency] = {}
-            self.graph[source_currency].update({destination_currency: (log_rate, timestamp)})
-            if not self.graph.keys().__contains__(destination_currency):
-                self.graph[destination_currency] = {}
-            self.graph[destination_currency].update({source_currency: (-log_rate, timestamp)})
+            if self.rates[i, j] != np.inf and timestamp < self.ts[i, j]:
+                # Quotes may come out of order since this is UDP/IP, so the process should ignore any
+                # quotes with timestamps before the latest one seen for that market.
+                logger.info('ignoring out-of-sequence message %s %s %s', micros_to_datetime(timestamp),
+                            source_currency, destination_currency)
+                continue
+            self.rates[i, j] = log_rate
+            self.rates[j, i] = -log_rate
+            self.ts[i, j] = self.ts[j, i] = timestamp
+            heapq.heappush(self.expiry_heap, (timestamp, i, j))
         self.remove_stale_quotes()
 
     def remove_stale_quotes(self):
-        now = datetime.now(timezone.utc)
-        source_to_remove = set()
-        for source_currency, entry in self.graph.items():
-            dest_to_remove = set()
-            for destination_currency, (value, timestamp) in entry.items():
-                if (now - timestamp).total_seconds() > STALENESS_TIMEOUT:
-                    dest_to_remove.add(destination_currency)
-                    print("removing stale quote for ('{}', '{}')".format(source_currency, destination_currency))
-            for currency in dest_to_remove:
-                entry.pop(currency)
-            if len(entry) == 0:
-                source_to_remove.add(source_currency)
-        for currency in source_to_remove:
-            self.graph.pop(currency)
+        """
+        Pop the quotes older than STALENESS_TIMEOUT off the expiry heap, and remove those that are still in force
+        from the graph (a superseded quote leaves its entry behind, with a timestamp that no longer matches).
+        """
+        expired = time.time_ns() // 1000 - STALENESS_MICROS  # in microseconds since the epoch, like the quotes
+        heap = self.expiry_heap
+        removed = []
+        while heap and heap[0][0] < expired:
+            timestamp, i, j = heapq.heappop(heap)
+            if self.rates[i, j] != np.inf and self.ts[i, j] == timestamp:
+                self.rates[i, j] = self.rates[j, i] = np.inf
+                removed.append((i, j))
+        if removed and logger.isEnabledFor(logging.DEBUG):  # one line per message, not one per quote
+            logger.debug('removed %d stale quotes: %s', len(removed),
+                         ', '.join('{}/{}'.format(self.currencies[i], self.currencies[j]) for i, j in removed))
 
     def report_arbitrage(self, cycle):
-        print('ARBITRAGE: \n')
+        logger.info('ARBITRAGE:')
+        logger.info('\t start with %s 100', cycle[0])
+        amount = 100
         for i in range(len(cycle) - 1):
             source_currency = cycle[i]
             destination_currency = cycle[i + 1]
-            exchange_rate = self.graph[source_currency][destination_currency][0]
-            print("\t \t Exchange {} for {} at {} --> {} {}".format(source_currency, destination_currency,
-                                                                    math.fabs(exchange_rate), destination_currency,
-                                                                    math.fabs(exchange_rate) * 100))
+            weight = self.rates[self.currency_idx[source_currency], self.currency_idx[destination_currency]]
+            exchange_rate = math.exp(-weight)  # the edge weight is -log(rate)
+            amount *= exchange_rate
+            logger.info('\t \t Exchange %s for %s at %s --> %s %s', source_currency, destination_currency,
+                        exchange_rate, destination_currency, amount)
 
     @staticmethod
-    def send_subscription_request(forex_publisher_address, listener_address):
-        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP) as send_sub_socket:
-            send_sub_socket.sendto(serialize_address(listener_address), forex_publisher_address)
+    def send_subscription_request(sock, forex_publisher_address):
+        """
+        Send the subscription from the listening socket itself, so it comes from the port the prices go to.
+
+        :param sock: the bound UDP socket the prices are received on
+        """
+        sock.sendto(serialize_address(sock.getsockname()), forex_publisher_address)
 
 
 if __name__ == '__main__':
-    print('Leila Lab3 Assignment')
+    logging.basicConfig(format=LOG_FORMAT, datefmt='%H:%M:%S', level=logging.INFO)
+    logger.info('Leila Lab3 Assignment')
     Subscriber()
@@ -19,21 +19,169 @@ value for a given key or add a key/value pair (with replacement).
 The `chord_node.py` module takes a port number of an existing node (or 0 to indicate it should start a new network).
 Then, it joins a new node into the network using a system-assigned port number for itself.
 The node joins and then listens for incoming connections (from other nodes or queriers).
-For listening it uses a blocking TCP socket and pickle for the marshaling the messages.
+For listening it uses one thread waiting on all its TCP sockets with a selector, and a small pool of threads to
+handle the requests, and pickle for the marshaling the messages. Each message is framed with its length, so a
+connection can carry any number of RPCs, and nodes keep their connections to each other open.
 """
 from datetime import datetime
 
+import functools
 import hashlib
+import itertools
+import logging
 import pickle
+import queue
+import selectors
 import socket
+import struct
 import sys
 import threading
 
 M = 7  # Network have at most 128 possible nodes (M=7, nodes count = 2^^7 = 128).
 NODES = 2 ** M
+MASK = NODES - 1  # x & MASK is x % NODES, NODES being a power of 2
+POWERS = tuple(1 << (k - 1) for k in range(1, M + 1))  # POWERS[k - 1] = 2^(k-1), the offset of finger k
 BUF_SZ = 4096  # socket recv arg
 BACKLOG = 100  # socket listen arg
+RPC_TIMEOUT = 5.0  # seconds to wait for a connection or a reply, every RPC here takes milliseconds
 TEST_BASE = 43500
+RPC_WORKERS = 8  # threads handling the requests a node receives
+LOG_FORMAT = '%(asctime)s.%(msecs)03d %(message)s'
+HEADER = struct.Struct('>I')  # 4-byte big-endian length prefix on every RPC message
+# The routing RPCs only carry small integers, so their requests are sent as one FAST_RPC struct: the method id then
+# an id, or the number and port of a node. The first byte of any other request is PICKLED_RPC, then the pickle.
+FAST_RPC = struct.Struct('>BHH')
+PICKLED_RPC = 0
+FAST_METHODS = {'successor': (1, None), 'find_successor': (2, 'id'), 'closest_preceding_finger': (3, 'id'),
+                'find_predecessor': (4, 'node'), 'update_your_predecessor': (5, 'node')}  # method -> (id, arg1)
+FAST_METHOD_IDS = {method_id: (method, arg) for method, (method_id, arg) in FAST_METHODS.items()}
+# A node is the tuple (number, port), as 3 bytes on the wire. The results of the routing RPCs are sent that way,
+# after a byte with the number of nodes in the result; other results are pickled, after a PICKLED_RPC byte.
+NODE = struct.Struct('>BH')
+encode_node = NODE.pack
+decode_node = NODE.unpack
+NODE_RESULTS = {'successor': 1, 'find_successor': 1, 'find_predecessor': 1, 'closest_preceding_finger': 2}
+
+logger = logging.getLogger(__name__)
+
+
+def recv_exact(sock, n):
+    """
+    Receive exactly n bytes from a stream socket, straight into one buffer of that size.
+
+    :return: the bytes received, as a bytearray
+    :raises EOFError: if the other end closes the connection first
+    """
+    data = bytearray(n)
+    view = memoryview(data)
+    got = 0
+    while got < n:
+        k = sock.recv_into(view[got:])
+        if not k:
+            raise EOFError('connection closed')
+        got += k
+    return data
+
+
+def send_frame(sock, payload):
+    """ Send the payload with its length in front of it """
+    sock.sendall(HEADER.pack(len(payload)) + payload)
+
+
+def recv_frame(sock):
+    """ Receive one payload sent with send_frame """
+    size, = HEADER.unpack(recv_exact(sock, HEADER.size))
+    return recv_exact(sock, size)
+
+
+def pack_result(method, result):
+    """
+    Marshal the result of an RPC, packed if it is the node (or nodes) a routing RPC returns, and pickled otherwise.
+
+    >>> pack_result('successor', (3, 43500))
+    b'\\x01\\x03\\xa9\\xec'
+    >>> unpack_result(pack_result('closest_preceding_finger', ((3, 43500), (9, 43501))))
+    ((3, 43500), (9, 43501))
+    >>> unpack_result(pack_result('successor', None)), unpack_result(pack_result('populate', 'Node 3 saved the row'))
+    (None, 'Node 3 saved the row')
+    """
+    count = NODE_RESULTS.get(method)
+    if count == 1 and result is not None:
+        return b'\x01' + encode_node(*result)
+    if count == 2 and None not in result:
+        return b'\x02' + encode_node(*result[0]) + encode_node(*result[1])
+    return bytes((PICKLED_RPC,)) + pickle.dumps(result)
+
+
+def unpack_result(payload):
+    """ The result of an RPC marshaled with pack_result """
+    view = memoryview(payload)
+    if payload[0] == 1:
+        return decode_node(view[1:])
+    if payload[0] == 2:  # closest_preceding_finger: the finger and the successor of the node asked
+        return decode_node(view[1:1 + NODE.size]), decode_node(view[1 + NODE.size:])
+    return pickle.loads(view[1:])
+
+
+def recv_result(sock):
+    """ Receive the result of an RPC sent over the socket with send_request """
+    return unpack_result(recv_frame(sock))
+
+
+def pack_request(method, arg1=None, arg2=None):
+    """
+    Marshal an RPC request, as a FAST_RPC struct if it is a routing RPC with small arguments and pickled otherwise.
+
+    >>> pack_request('find_successor', 5)
+    b'\\x02\\x00\\x05\\x00\\x00'
+    >>> unpack_request(pack_request('find_predecessor', (3, 43500)))
+    ('find_predecessor', (3, 43500), None)
+    >>> unpack_request(pack_request('populate', ['a', 'b'])) == ('populate', ['a', 'b'], None)
+    True
+    """
+    method_id, arg = FAST_METHODS.get(method, (None, None))
+    if method_id is not None and arg2 is None:
+        if arg is None:
+            return FAST_RPC.pack(method_id, 0, 0)
+        if arg == 'id' and isinstance(arg1, int) and 0 <= arg1 <= 0xFFFF:
+            return FAST_RPC.pack(method_id, arg1, 0)
+        if arg == 'node' and isinstance(arg1, tuple):
+            return FAST_RPC.pack(method_id, *arg1)
+    return bytes((PICKLED_RPC,)) + pickle.dumps((method, arg1, arg2))
+
+
+def unpack_request(payload):
+    """ The (method, arg1, arg2) of a request marshaled with pack_request """
+    if payload[0] == PICKLED_RPC:
+        return pickle.loads(memoryview(payload)[1:])
+    method_id, first, second = FAST_RPC.unpack(payload)
+    method, arg = FAST_METHOD_IDS[method_id]
+    if arg == 'node':
+        return method, (first, second), None
+    return method, (first if arg == 'id' else None), None
+
+
+def send_request(sock, method, arg1=None, arg2=None):
+    """ Send an RPC request """
+    send_frame(sock, pack_request(method, arg1, arg2))
+
+
+def recv_request(sock):
+    """ Receive one request sent with send_request, as (method, arg1, arg2) """
+    return unpack_request(recv_frame(sock))
+
+
+def in_mod_range(id, start, stop, divisor=NODES):
+    """
+    Is id in [start, stop) wrapping around 0 at divisor, the whole circle when start == stop? The same as
+    id in ModRange(start, stop, divisor), without building the object.
+
+    >>> in_mod_range(1, 1, 4, 100), in_mod_range(4, 1, 4, 100), in_mod_range(0, 97, 2, 100)
+    (True, False, True)
+    >>> in_mod_range(3, 0, 0, 5)
+    True
+    """
+    return (id - start) % divisor < (stop - start - 1) % divisor + 1
 
 
 class ModRange(object):
@@ -74,10 +222,7 @@ class ModRange(object):
 
     def __contains__(self, id):
         """ Is the given id within this finger's interval? """
-        for interval in self.intervals:
-            if id in interval:
-                return True
-        return False
+        return any(id in interval for interval in self.intervals)
 
     def __len__(self):
         total = 0
@@ -86,28 +231,7 @@ class ModRange(object):
         return total
 
     def __iter__(self):
-        return ModRangeIter(self, 0, -1)
-
-
-class ModRangeIter(object):
-    """ Iterator class for ModRange """
-
-    def __init__(self, mr, i, j):
-        self.mr, self.i, self.j = mr, i, j
-
-    def __iter__(self):
-        return ModRangeIter(self.mr, self.i, self.j)
-
-    def __next__(self):
-        if self.j == len(self.mr.intervals[self.i]) - 1:
-            if self.i == len(self.mr.intervals) - 1:
-                raise StopIteration()
-            else:
-                self.i += 1
-                self.j = 0
-        else:
-            self.j += 1
-        return self.mr.intervals[self.i][self.j]
+        return itertools.chain.from_iterable(self.intervals)
 
 
 class FingerEntry(object):
@@ -134,9 +258,8 @@ class FingerEntry(object):
     def __init__(self, n, k, node=None):
         if not (0 <= n < NODES and 0 < k <= M):
             raise ValueError('invalid finger entry values')
-        self.start = (n + 2 ** (k - 1)) % NODES
-        self.next_start = (n + 2 ** k) % NODES if k < M else n
-        self.interval = ModRange(self.start, self.next_start, NODES)
+        self.start = (n + POWERS[k - 1]) & MASK
+        self.next_start = (n + POWERS[k]) & MASK if k < M else n
         self.successor = node  # This is the next active node. That is, what would
         # the node be if I wanted to store data in this interval?
 
@@ -146,12 +269,41 @@ class FingerEntry(object):
 
     def __contains__(self, id):
         """ Is the given id within this finger's interval? """
-        return id in self.interval
+        return in_mod_range(id, self.start, self.next_start)
+
 
+_SHA1_PROTOTYPE = hashlib.sha1()  # a fresh SHA-1 state; copying it is cheaper than building a new one
 
+
+@functools.lru_cache(maxsize=8192)  # the same ids get hashed again by every node a row or query passes through
 def sha1_hash(id_string):
-    result = hashlib.sha1(id_string.encode())
-    return int(result.hexdigest(), 16)
+    result = _SHA1_PROTOTYPE.copy()
+    result.update(id_string.encode())
+    return int.from_bytes(result.digest(), 'big')
+
+
+def sha1_bucket(id_string):
+    """
+    sha1_hash(id_string) % NODES, from the last byte of the digest alone (NODES divides 256).
+
+    >>> sha1_bucket('tomfarris/25138611948') == sha1_hash('tomfarris/25138611948') % NODES
+    True
+    """
+    result = _SHA1_PROTOTYPE.copy()
+    result.update(id_string.encode())
+    return result.digest()[-1] & MASK
+
+
+class Connection(object):
+    """ What the listener keeps for one accepted connection """
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.inbox = bytearray()  # bytes received and not yet taken as a request
+        self.outbox = bytearray()  # framed results not sent yet
+        self.busy = False  # one of its requests is being handled; the next waits, so results go back in order
+        self.closed = False
+        self.events = 0  # what it is registered with the selector for
 
 
 class ChordNode(object):
@@ -159,40 +311,149 @@ class ChordNode(object):
         self.port_number = 0 if port_number > 0 else TEST_BASE
         self.if_first = True if port_number == 0 else False
         self.predecessor = None
-        self.keys = {}  # dictionary <data_id, data_value> to store data
+        self.keys = {}  # dictionary <data_id, (bucket_id, data_value)> to store data
         self.identifier = None
         self.node = None
         self.node_socket = None
+        self._conn_pool = {}  # port -> open connection to that node that no RPC is using at the moment
+        self._pool_lock = threading.Lock()
+        self._state_lock = threading.Lock()  # for keys and finger_table, which the RPC workers change
+        self._requests = queue.SimpleQueue()  # (connection, request) for the workers to handle
+        self._results = queue.SimpleQueue()  # (connection, framed result or None to close it) from the workers
+        self._wake_reader, self._wake_writer = socket.socketpair()  # workers wake the listener up with a byte
         threading.Thread(target=self.start_listening).start()
         self.finger_table = self.initialize_empty_finger_table()
         if self.if_first:
             self.join()
         else:
             endpoint_string = '127.0.0.0 ' + str(port_number)
-            node_p = {'number': sha1_hash(endpoint_string) % 2 ** M, 'port': port_number}
+            node_p = (sha1_bucket(endpoint_string), port_number)
             self.join(node_p)
 
     def start_listening(self):
         """
         This function starts a listener socket for handling incoming RPC requests.
-        It wait for accepting requests.
-        When it receives a request, it starts a thread, runs an RPC handler function on the
-        new thread, and then returns to listening mode.
-        :return:
+        This thread waits on the listener and on every accepted connection at once with a selector (epoll on
+        Linux), all non-blocking. Each request received is handed to a pool of RPC_WORKERS threads, and the
+        worker hands the result back to this thread to send.
         """
+        for _ in range(RPC_WORKERS):
+            threading.Thread(target=self.handle_rpcs).start()
         try:
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as listener:
+            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as listener, selectors.DefaultSelector() as selector:
                 self.node_socket = listener
                 self.node_socket.bind(('localhost', self.port_number))
-                self.node_socket.setblocking(True)
                 self.node_socket.listen()
                 self.port_number = self.node_socket.getsockname()[1]
-                print('Node just started listening on port {}.'.format(self.port_number))
+                logger.debug('Node just started listening on port %s.', self.port_number)
+                listener.setblocking(False)
+                self._wake_reader.setblocking(False)
+                self._wake_writer.setblocking(False)
+                selector.register(listener, selectors.EVENT_READ)
+                selector.register(self._wake_reader, selectors.EVENT_READ)
                 while True:
-                    client, client_addr = self.node_socket.accept()
-                    threading.Thread(target=self.handle_rpc, args=(client,)).start()
+                    for key, mask in selector.select():
+                        if key.fileobj is listener:
+                            client, client_addr = listener.accept()
+                            client.setblocking(False)
+                            self.update_events(Connection(client), selector)
+                        elif key.fileobj is self._wake_reader:
+                            self.collect_results(selector)
+                        else:
+                            conn = key.data
+                            if mask & selectors.EVENT_READ and not conn.closed:
+                                self.receive_requests(conn, selector)
+                            if mask & selectors.EVENT_WRITE and not conn.closed:
+                                self.send_results(conn, selector)
         except Exception as e:
-            print("Error occurred in starting a listener server for the node: {}. Error = {}".format(self.node, e))
+            logger.error("Error occurred in starting a listener server for the node: %s. Error = %s", self.node, e)
+
+    @staticmethod
+    def update_events(conn, selector):
+        """
+        Register a connection for what it waits for: the next request unless one of its requests is being
+        handled, and sending while it has results to send.
+        """
+        events = (0 if conn.busy else selectors.EVENT_READ) | (selectors.EVENT_WRITE if conn.outbox else 0)
+        if events == conn.events:
+            return
+        if not conn.events:
+            selector.register(conn.sock, events, conn)
+        elif not events:
+            selector.unregister(conn.sock)
+        else:
+            selector.modify(conn.sock, events, conn)
+        conn.events = events
+
+    def receive_requests(self, conn, selector):
+        try:
+            data = conn.sock.recv(BUF_SZ)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            data = b''
+        if not data:
+            self.close_connection(conn, selector)
+            return
+        conn.inbox += data
+        self.start_next_request(conn, selector)
+
+    def start_next_request(self, conn, selector):
+        """
+        Hand the next whole request received on a connection to a worker, unless one of them is being handled.
+        While it is, nothing more is read from the connection.
+        """
+        inbox = conn.inbox
+        if not conn.busy and len(inbox) >= HEADER.size:
+            end = HEADER.size + HEADER.unpack_from(inbox)[0]
+            if len(inbox) >= end:
+                request = bytes(inbox[HEADER.size:end])
+                del inbox[:end]
+                conn.busy = True
+                self._requests.put((conn, request))
+        self.update_events(conn, selector)
+
+    def collect_results(self, selector):
+        """ Take the results the workers are done with, send them and move on to the next requests """
+        try:
+            while self._wake_reader.recv(BUF_SZ):
+                pass
+        except (BlockingIOError, InterruptedError):
+            pass
+        while True:
+            try:
+                conn, frame = self._results.get_nowait()
+            except queue.Empty:
+                return
+            conn.busy = False
+            if conn.closed:
+                continue
+            if frame is None:
+                self.close_connection(conn, selector)
+                continue
+            conn.outbox += frame
+            self.send_results(conn, selector)  # right away, it mostly fits in the socket buffer
+            if not conn.closed:
+                self.start_next_request(conn, selector)
+
+    def send_results(self, conn, selector):
+        try:
+            sent = conn.sock.send(conn.outbox)
+        except (BlockingIOError, InterruptedError):
+            sent = 0
+        except OSError:
+            self.close_connection(conn, selector)
+            return
+        del conn.outbox[:sent]
+        self.update_events(conn, selector)
+
+    @staticmethod
+    def close_connection(conn, selector):
+        if conn.events:
+            selector.unregister(conn.sock)
+            conn.events = 0
+        conn.closed = True
+        conn.sock.close()
 
     def initialize_empty_finger_table(self):
         """
@@ -229,7 +490,7 @@ class ChordNode(object):
             continue
         endpoint_string = '127.0.0.0' + str(self.port_number)
         self.identifier = sha1_hash(endpoint_string)
-        self.node = self.identifier % (2 ** M)
+        self.node = self.identifier & MASK
         finger_table = [None] + [FingerEntry(self.node, k) for k in range(1, M + 1)]  # indexing starts at 1
         return finger_table
 
@@ -260,10 +521,10 @@ class ChordNode(object):
 
         else:  # this is the only (first) node joining in the network
             for i in range(1, M + 1):
-                self.finger_table[i].successor = {'number': self.node, 'port': self.port_number}
-            self.predecessor = {'number': self.node, 'port': self.port_number}
-        print('Node {} just joined the Chord network and listening on port {}'.format(self.node, self.port_number))
-        print("--------------Finger table node {} after join:--------------".format(self.node))
+                self.finger_table[i].successor = (self.node, self.port_number)
+            self.predecessor = (self.node, self.port_number)
+        logger.info('Node %s just joined the Chord network and listening on port %s', self.node, self.port_number)
+        logger.debug("--------------Finger table node %s after join:--------------", self.node)
         self.print_finger_table()
         self.print_node_info()
 
@@ -280,33 +541,88 @@ class ChordNode(object):
         if other_node == self.port_number:
             result = self.dispatch_rpc(method, arg1, arg2)
             return result
-        client = ('localhost', other_node)
+        with self._pool_lock:
+            requester = self._conn_pool.pop(other_node, None)  # taken out, so no other thread uses it meanwhile
         try:
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as requester:
-                requester.settimeout(1500)
-                requester.connect(client)
-                requester.sendto(pickle.dumps((method, arg1, arg2)), client)
-                # print('calling receive & waiting to get result from {} for method {}'.format(other_node, method))
-                response = requester.recv(BUF_SZ)
-                return pickle.loads(response)
+            if requester is not None and self.closed_while_idle(requester):
+                requester.close()  # nothing was sent on it yet, so a new one can take the request
+                requester = None
+            if requester is None:
+                requester = self.connect(other_node)
+            response = self.rpc_over(requester, (method, arg1, arg2))
         except Exception as e:
-            print("I'm node {}, Exception occurred in call function via rpc: {}".format(self.node, e))
+            logger.error("I'm node %s, Exception occurred in call function via rpc: %s", self.node, e)
             exit()
+        with self._pool_lock:
+            spare = self._conn_pool.setdefault(other_node, requester) is not requester
+        if spare:  # another thread already put a connection to that node back
+            requester.close()
+        return response
+
+    @staticmethod
+    def connect(other_node):
+        """
+        Open a connection to the node listening on the given port.
+        """
+        requester = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        requester.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)  # every RPC is one small message
+        requester.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)  # it stays open in the pool
+        requester.settimeout(RPC_TIMEOUT)
+        requester.connect(('localhost', other_node))
+        return requester
+
+    @staticmethod
+    def closed_while_idle(requester):
+        """
+        Whether the other node has closed a pooled connection since it was last used, which is known before anything
+        is sent on it. Once a request went out, a closed connection may mean the request was handled part way, so
+        only this check decides whether a request goes again on a new connection.
+
+        :return: True if the connection has an EOF or an error waiting, False if it is open and has nothing to read
+        """
+        requester.setblocking(False)  # with a time out set, recv would wait for data instead of returning
+        try:
+            return not requester.recv(1, socket.MSG_PEEK)
+        except BlockingIOError:
+            return False
+        except OSError:  # e.g. a reset that came in while it was idle
+            return True
+        finally:
+            requester.settimeout(RPC_TIMEOUT)
+
+    @staticmethod
+    def rpc_over(requester, request):
+        """
+        Send one framed request over a connection and return the response.
+        """
+        send_request(requester, *request)
+        return recv_result(requester)
+
+    def handle_rpcs(self):
+        """ Body of a worker thread: handle the requests the listener hands over, one after the other """
+        while True:
+            self.handle_rpc(*self._requests.get())
 
-    def handle_rpc(self, client):
+    def handle_rpc(self, conn, request):
         """
-        This function handles rpc requests from other nodes in the network and also clients and responds to them.
+        This function handles rpc requests from other nodes in the network and also clients, on a worker thread.
+        The framed result goes back to the listener thread to be sent.
 
-        :param client: is the network node or client that sent the rpc request.
+        :param conn: the connection of the network node or client that sent the rpc request
+        :param request: the request, as pack_request marshaled it
         """
         try:
-            rpc = client.recv(BUF_SZ)
-            method, arg1, arg2 = pickle.loads(rpc)
-            result = self.dispatch_rpc(method, arg1, arg2)
-            client.sendall(pickle.dumps(result))
-        except Exception as e:
-            print("I'm node {}, Exception occurred in call function via rpc: {}".format(self.node, e))
-            exit()
+            method, arg1, arg2 = unpack_request(request)
+            payload = pack_result(method, self.dispatch_rpc(method, arg1, arg2))
+            frame = HEADER.pack(len(payload)) + payload
+        except (Exception, SystemExit) as e:  # dispatch_rpc exits on missing arguments
+            logger.error("I'm node %s, Exception occurred in call function via rpc: %s", self.node, e)
+            frame = None  # so the connection gets closed
+        self._results.put((conn, frame))
+        try:
+            self._wake_writer.send(b'\0')
+        except BlockingIOError:
+            pass  # the listener has enough wake up bytes waiting already
 
     def dispatch_rpc(self, method, arg1, arg2):
         if method == 'successor':
@@ -314,40 +630,46 @@ class ChordNode(object):
         if method == 'update_finger_table':
             # arg1 = node details(identifier) and arg2 = index
             if arg1 is None or arg2 is None:
-                print("Argument for calling `update_finger_table` method is not provided.")
+                logger.error("Argument for calling `update_finger_table` method is not provided.")
                 exit()
             else:
                 self.update_finger_table(arg1, arg2)
         elif method == 'find_predecessor':
-            if arg1['number'] == self.node:
+            if arg1[0] == self.node:
                 return self.predecessor
             else:
                 return self.find_predecessor(arg1)
         elif method == 'update_your_predecessor':
             if arg1 is None:
-                print("Argument for calling `update_your_predecessor` method is not provided.")
+                logger.error("Argument for calling `update_your_predecessor` method is not provided.")
                 exit()
             self.predecessor = arg1
         elif method == 'find_successor':
             if arg1 is None:
-                print("Argument for calling `find_successor` method is not provided.")
+                logger.error("Argument for calling `find_successor` method is not provided.")
                 exit()
             return self.find_successor(arg1)
+        elif method == 'find_successors_batch':
+            if arg1 is None:
+                logger.error("Argument for calling `find_successors_batch` method is not provided.")
+                exit()
+            return [self.find_successor(id) for id in arg1]
         elif method == 'closest_preceding_finger':
             if arg1 is None:
-                print("Argument for calling `closest_preceding_finger` method is not provided.")
+                logger.error("Argument for calling `closest_preceding_finger` method is not provided.")
                 exit()
-            return self.closest_preceding_finger(arg1)
+            # with this node's successor, which the caller tests before it goes on to the finger
+            return self.closest_preceding_finger(arg1), self.successor
         elif method == 'populate':
             if arg1 is None:
-                print("Argument for calling `save_data` method is not provided.")
+                logger.error("Argument for calling `save_data` method is not provided.")
                 return "The row to populate is either missing or incorrect."
             return self.save_data(arg1)
         elif method == 'put_key':
             return self.put_key(arg1, arg2)
         elif method == 'query':
             if arg1 is None or arg2 is None:
-                print("Arguments for calling `get_data` method is not provided.")
+                logger.error("Arguments for calling `get_data` method is not provided.")
                 return "Pass the player id and year to find the row."
             return self.query_data(arg1, arg2)
         elif method == 'get_key':
@@ -364,26 +686,29 @@ class ChordNode(object):
     def find_successor(self, id):
         """ Ask this node to find id's successor = successor(predecessor(id))"""
         node_p = self.find_predecessor(id)
-        return self.call_rpc(node_p['port'], 'successor')
+        return self.call_rpc(node_p[1], 'successor')
 
     def find_predecessor(self, id):
-        node_p_number = self.node
-        node_p_successor = self.successor
-        node_p_port = self.port_number
-        while id not in ModRange(node_p_number + 1, node_p_successor['number'] + 1, NODES):
-            node_p = self.call_rpc(node_p_port, 'closest_preceding_finger', id)  # np = np.closest_preceding_finger(id)
-
-            node_p_number = node_p['number']
-            node_p_successor = self.call_rpc(node_p_port, 'successor')
-            node_p_port = node_p['port']
-
-        return {'number': node_p_number, 'port': node_p_port}
+        """
+        Walk the fingers toward id with one RPC per node: each node asked answers with its successor as well as
+        its closest preceding finger, so the walk either stops at that node or goes on to the finger.
+        """
+        node_p = (self.node, self.port_number)
+        finger, successor = self.closest_preceding_finger(id), self.successor  # what this node would answer
+        while not in_mod_range(id, node_p[0] + 1, successor[0] + 1):
+            node_p = finger  # np = np.closest_preceding_finger(id)
+            finger, successor = self.call_rpc(node_p[1], 'closest_preceding_finger', id)
+        return node_p
 
     def closest_preceding_finger(self, id):
+        # in_mod_range(number, self.node + 1, id) for each finger, with the bound worked out once
+        start = self.node + 1
+        span = ((id - start - 1) & MASK) + 1
         for i in range(M, 0, -1):
-            if self.finger_table[i].successor['number'] in ModRange(self.node + 1, id, NODES):
-                return self.finger_table[i].successor
-        return {'number': self.node, 'port': self.port_number}
+            successor = self.finger_table[i].successor
+            if (successor[0] - start) & MASK < span:
+                return successor
+        return self.node, self.port_number
 
     def init_finger_table(self, node_p):
         """
@@ -392,19 +717,24 @@ class ChordNode(object):
 
         :param node_p: is an arbitrary node already in the network
         """
-        self.finger_table[1].successor = self.call_rpc(node_p['port'], 'find_successor', self.finger_table[
+        self.finger_table[1].successor = self.call_rpc(node_p[1], 'find_successor', self.finger_table[
             1].start)  # node_p.find_successor(self.finger_table[1].start)
-        self.predecessor = self.call_rpc(self.successor['port'], 'find_predecessor',
+        self.predecessor = self.call_rpc(self.successor[1], 'find_predecessor',
                                          self.successor)  # self.predecessor = self.successor.predecessor
-        self.call_rpc(self.successor['port'], 'update_your_predecessor',
-                      {'number': self.node, 'port': self.port_number})  # self.successor.predecessor = self.node
+        self.call_rpc(self.successor[1], 'update_your_predecessor',
+                      (self.node, self.port_number))  # self.successor.predecessor = self.node
+        # the starts past the successor can't be filled in from the fingers before them, so node_p finds all
+        # of their successors in one RPC
+        remote = [self.finger_table[i].start for i in range(2, M + 1)
+                  if not in_mod_range(self.finger_table[i].start, self.node, self.successor[0])]
+        found = dict(zip(remote, self.call_rpc(node_p[1], 'find_successors_batch', remote))) if remote else {}
         for i in range(1, M):
-            if self.finger_table[i + 1].start in ModRange(self.node, self.finger_table[i].successor['number'], NODES):
-                # self.node <= self.finger_table[i + 1].start < self.finger_table[i].successor['number']:
+            if in_mod_range(self.finger_table[i + 1].start, self.node, self.finger_table[i].successor[0]):
+                # self.node <= self.finger_table[i + 1].start < self.finger_table[i].successor[0]:
                 self.finger_table[i + 1].successor = self.finger_table[i].successor
             else:
-                self.finger_table[i + 1].successor = self.call_rpc(node_p['port'], 'find_successor', self.finger_table[
-                    i + 1].start)  # node_p.find_successor(self.finger_table[i + 1].start)
+                # node_p.find_successor(self.finger_table[i + 1].start)
+                self.finger_table[i + 1].successor = found[self.finger_table[i + 1].start]
 
     def update_finger_table(self, s, i):
         """
@@ -412,13 +742,15 @@ class ChordNode(object):
         :param s: new node for entry i
         :param i: the index of finger table
         """
-        if self.finger_table[i].start != self.finger_table[i].successor['number'] \
-                and s['number'] in \
-                ModRange(self.finger_table[i].start, self.finger_table[i].successor['number'], NODES):
-            self.finger_table[i].successor = s
+        with self._state_lock:
+            updated = self.finger_table[i].start != self.finger_table[i].successor[0] \
+                and in_mod_range(s[0], self.finger_table[i].start, self.finger_table[i].successor[0])
+            if updated:
+                self.finger_table[i].successor = s
+        if updated:  # not holding the lock, as the update may well come back to this node
             p = self.predecessor  # get first node preceding this local node
-            self.call_rpc(p['port'], 'update_finger_table', s, i)
-        print("--------------Finger table node {} after update:--------------".format(self.node))
+            self.call_rpc(p[1], 'update_finger_table', s, i)
+        logger.debug("--------------Finger table node %s after update:--------------", self.node)
         self.print_finger_table()
         self.print_node_info()
 
@@ -426,11 +758,13 @@ class ChordNode(object):
         """
         This function updates all nodes whose finger tables should refer to this local node
         """
-        for i in range(1, M + 1):
+        # the i-th finger of the nodes preceding these ids might be this local node
+        predecessors_of_node = [(self.node - POWERS[i - 1] + 1) & MASK for i in range(1, M + 1)]
+        for i, id in enumerate(predecessors_of_node, 1):
             # find the last node p whose i-th finger might be this local node
-            node_p = self.find_predecessor((1 + self.node - 2 ** (i - 1) + NODES) % NODES)
+            node_p = self.find_predecessor(id)
             # node_p.update_finger_table(self.node, i)
-            self.call_rpc(node_p['port'], 'update_finger_table', {'number': self.node, 'port': self.port_number}, i)
+            self.call_rpc(node_p[1], 'update_finger_table', (self.node, self.port_number), i)
 
     def put_key(self, key_id, key_value):
         """
@@ -438,8 +772,9 @@ class ChordNode(object):
 
         :return: True, indicates the <key_id, key_value> pair successfully added
         """
-        self.keys[key_id] = key_value
-        self.print_keys_dictionary()
+        with self._state_lock:
+            self.keys[key_id] = (key_id & MASK, key_value)  # keep the bucket, for printing
+            self.print_keys_dictionary()
         self.print_node_info()
         return True
 
@@ -449,10 +784,12 @@ class ChordNode(object):
         keys dictionary for 'key_id,' or None if the keys dictionary does not contain
         a pair with key equal to the input id.
         """
-        if key_id not in self.keys.keys():
-            print("This id is not available in node {} keys dictionary".format(self.node))
+        with self._state_lock:
+            entry = self.keys.get(key_id)
+        if entry is None:
+            logger.debug("This id is not available in node %s keys dictionary", self.node)
             return None
-        return self.keys[key_id]
+        return entry[1]
 
     def save_data(self, input):
         """
@@ -466,11 +803,11 @@ class ChordNode(object):
         player_id = row[0]
         year = row[3]
         data_id = sha1_hash(str(player_id) + str(year))
-        bucket_id = data_id % 2 ** M
-        responsible = self.call_rpc(self.port_number, 'find_successor', bucket_id)
-        done = self.call_rpc(responsible['port'], 'put_key', data_id, row)
+        bucket_id = data_id & MASK  # data_id is needed anyway, so no second hashing
+        responsible = self.find_successor(bucket_id)
+        done = self.call_rpc(responsible[1], 'put_key', data_id, row)
         if done:
-            return "Node {} saved the row".format(responsible['number'])
+            return "Node {} saved the row".format(responsible[0])
         else:
             return "Populate failed"
 
@@ -484,10 +821,10 @@ class ChordNode(object):
         :return: a row or a string describing the result of query result
         """
         data_id = sha1_hash(str(player_id) + str(year))
-        bucket_id = data_id % 2 ** M
-        responsible = self.call_rpc(self.port_number, 'find_successor', bucket_id)
+        bucket_id = data_id & MASK
+        responsible = self.find_successor(bucket_id)
         try:
-            row = self.call_rpc(responsible['port'], 'get_key', data_id)
+            row = self.call_rpc(responsible[1], 'get_key', data_id)
             if row is None:
                 return "Data is not available."
             if isinstance(row, list):
@@ -495,33 +832,37 @@ class ChordNode(object):
             else:
                 return "Query failed!"
         except Exception as e:
-            print("Query failed! Error = {}".format(e))
+            logger.error("Query failed! Error = %s", e)
             return "Query failed!"
 
+    # The print_ functions log at DEBUG level, and return straight away when that isn't enabled: they run on
+    # every join, finger table update and stored key.
     def print_finger_table(self):
+        if not logger.isEnabledFor(logging.DEBUG):
+            return
         for entry in self.finger_table:
             if entry is None:
                 continue
-            print("entry.start = {} \t entry.stop = {} \t entry.successor = {} \t "
-                  .format(entry.start, entry.interval.stop,
-                          entry.successor))
+            logger.debug("entry.start = %s \t entry.stop = %s \t entry.successor = %s \t ",
+                         entry.start, entry.next_start, entry.successor)
 
     def print_node_info(self):
-        print('[{}] Node {} is listening on port {}'.format(datetime.now().strftime("%I:%M:%S.%f"), self.node,
-                                                            self.port_number))
-        print('\tsuccessor = {}\t\tpredecessor = {}'.format(self.successor['number'], self.predecessor['number']))
+        if not logger.isEnabledFor(logging.DEBUG):
+            return
+        logger.debug('[%s] Node %s is listening on port %s', datetime.now().strftime("%I:%M:%S.%f"), self.node,
+                     self.port_number)
+        logger.debug('\tsuccessor = %s\t\tpredecessor = %s', self.successor[0], self.predecessor[0])
 
     def print_keys_dictionary(self):
-        print("-------------- Keys in node {} --------------".format(self.node))
-        for key, value in self.keys.items():
-            player_id = value[0]
-            year = value[3]
-            data_id = sha1_hash(str(player_id) + str(year))
-            bucket_id = data_id % 2 ** M
-            print('\t\t', bucket_id, ' : ', value[0])
+        if not logger.isEnabledFor(logging.DEBUG):
+            return
+        logger.debug("-------------- Keys in node %s --------------", self.node)
+        for bucket_id, value in self.keys.values():
+            logger.debug('\t\t %s  :  %s', bucket_id, value[0])
 
 
 if __name__ == '__main__':
     args = sys.argv[1:]
     node_port = int(args[0])
+    logging.basicConfig(format=LOG_FORMAT, datefmt='%H:%M:%S', level=logging.INFO)
     ChordNode(node_port)
@@ -8,19 +8,43 @@ It takes a port number of an existing node in the Chord and the file name of the
 This module sends data, row by row to an arbitrary Chord node whose port number is given as input.
 """
 import csv
-import hashlib
-import pickle
+import queue
 import socket
 import sys
+import threading
 
 import chord_node
 
 BUF_SZ = chord_node.BUF_SZ
+sha1_bucket = chord_node.sha1_bucket
 
 
-def sha1_hash(id_string):
-    result = hashlib.sha1(id_string.encode())
-    return int(result.hexdigest(), 16)
+def print_results(reader, pending):
+    """
+    Receive and print the result of each populate request, while the rows are still being sent.
+    The node answers the requests on a connection in the order they were sent, so the n-th result is for the n-th row.
+
+    :param reader: the connection the rows are sent on
+    :param pending: queue of the (counter, row) pairs sent, in order, then None after the last one
+    """
+    try:
+        while True:
+            item = pending.get()
+            if item is None:
+                return
+            counter, row = item
+            populate_result = chord_node.recv_result(reader)
+
+            player_id = row[0]
+            year = row[3]
+            bucket_id = sha1_bucket(str(player_id) + str(year))
+            print('Row {}, identifier string = {} \t This will be stored in id {}'.format(counter,
+                                                                                          player_id + year,
+                                                                                          bucket_id))
+            print(populate_result)
+            print('------------------------------')
+    except Exception as e:
+        print("Error occurred in receiving populate results: {}".format(e))
 
 
 if __name__ == '__main__':
@@ -33,32 +57,27 @@ if __name__ == '__main__':
     first_row = True
     counter = 1
     try:
-        with open(data_file_name, newline='') as csv_file:
-            spam_reader = csv.reader(csv_file, delimiter=',')
-            for row in spam_reader:
-                # if counter == 31:
-                #     break
-                if first_row:
-                    first_row = False
-                    continue
-
-                server_address = ('localhost', node_port)
-                with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as writer:
-                    writer.settimeout(1500)
-                    writer.connect(server_address)
-                    request = ('populate', row, None)  # RPC handler of the nodes receives a tuple with three items
-                    writer.sendto(pickle.dumps(request), server_address)
-                    populate_result = writer.recv(BUF_SZ)
-
-                    player_id = row[0]
-                    year = row[3]
-                    data_row_id = sha1_hash(str(player_id) + str(year))
-                    bucket_id = data_row_id % 2 ** chord_node.M
-                    print('Row {}, identifier string = {} \t This will be stored in id {}'.format(counter,
-                                                                                                  player_id + year,
-                                                                                                  bucket_id))
-                    print(pickle.loads(populate_result))
-                print('------------------------------')
-                counter += 1
+        server_address = ('localhost', node_port)
+        # all the rows go over one connection, one after the other without waiting for each result
+        with open(data_file_name, newline='') as csv_file, \
+                socket.socket(socket.AF_INET, socket.SOCK_STREAM) as writer:
+            writer.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            writer.settimeout(chord_node.RPC_TIMEOUT)
+            writer.connect(server_address)
+            pending = queue.Queue()
+            receiver = threading.Thread(target=print_results, args=(writer, pending))
+            receiver.start()
+            try:
+                spam_reader = csv.reader(csv_file, delimiter=',')
+                for row in spam_reader:
+                    if first_row:
+                        first_row = False
+                        continue
+                    pending.put((counter, row))
+                    chord_node.send_request(writer, 'populate', row)
+                    counter += 1
+            finally:
+                pending.put(None)
+                receiver.join()
     except Exception as e:
         print("Error occurred in populating data: {}".format(e))
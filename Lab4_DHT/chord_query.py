@@ -8,7 +8,6 @@ It takes a port number of an existing node in the Chord, played id and year.
 This module sends player id and year to the Chord node whose port number is given as input.
 It prints the data row or an appropriate message after querying the Chord network.
 """
-import pickle
 import socket
 import sys
 import chord_node
@@ -27,11 +26,11 @@ if __name__ == '__main__':
     try:
         server_address = ('localhost', node_port)
         with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as query_socket:
-            query_socket.settimeout(1500)
+            query_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            query_socket.settimeout(chord_node.RPC_TIMEOUT)
             query_socket.connect(server_address)
-            request = ('query', player_id, year)  # RPC handler of the nodes receives a tuple with three items
-            query_socket.sendto(pickle.dumps(request), server_address)
-            query_result = pickle.loads(query_socket.recv(BUF_SZ))
+            chord_node.send_request(query_socket, 'query', player_id, year)
+            query_result = chord_node.recv_result(query_socket)
             print(query_result)
     except Exception as e:
         print("Error occurred in populating data: {}".format(e))